@@ -0,0 +1,437 @@
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+import zlib
+
+import pygame
+
+import spacefighter as sf
+
+ENTITY_COUNTS = (10, 100, 1000, 10000)
+
+# A field of moving enemy- and bullet-sized sprites, drawn with the game's
+# placeholder images. Bullets are a tenth of the enemies, roughly what
+# sustained fire adds on top of a crowded screen.
+class CollisionField:
+    def __init__(self, count, seed=0):
+        self.rng = random.Random(seed)
+        self.enemies = pygame.sprite.Group()
+        self.bullets = pygame.sprite.Group()
+        enemy_size = (int(sf.SCREEN_WIDTH * 0.05), int(sf.SCREEN_HEIGHT * 0.07))
+        bullet_size = (max(int(sf.SCREEN_WIDTH * 0.006), 3), max(int(sf.SCREEN_HEIGHT * 0.015), 8))
+        enemy_image = sf.shared_shape(('enemy', 'regular', *enemy_size),
+                                      lambda: sf.enemy_placeholder('regular', *enemy_size))
+        bullet_image = sf.shared_shape(('bullet', *bullet_size),
+                                       lambda: sf.bullet_image(*bullet_size))
+        for i in range(count):
+            self.enemies.add(self.make_sprite(i, enemy_image, (-3, 4), (1, 6)))
+        for i in range(max(1, count // 10)):
+            self.bullets.add(self.make_sprite(i, bullet_image, (0, 1), (-10, -9)))
+
+    def make_sprite(self, index, image, speedx_range, speedy_range):
+        sprite = pygame.sprite.Sprite()
+        sprite.index = index
+        sprite.image = image
+        sprite.rect = image.get_rect(x=self.rng.randrange(sf.SCREEN_WIDTH),
+                                     y=self.rng.randrange(sf.SCREEN_HEIGHT))
+        sprite.speedx = self.rng.randrange(*speedx_range)
+        sprite.speedy = self.rng.randrange(*speedy_range)
+        return sprite
+
+    def move(self):
+        for group in (self.enemies, self.bullets):
+            for sprite in group:
+                rect = sprite.rect
+                rect.x = (rect.x + sprite.speedx) % sf.SCREEN_WIDTH
+                rect.y = (rect.y + sprite.speedy) % sf.SCREEN_HEIGHT
+
+# Time collide() over moving frames until min_time has passed or max_frames
+# have run. Movement is not counted; grid maintenance is, since the grid has to
+# be refiled every frame. Hits are recorded by sprite index for comparison.
+def time_frames(field, collide, min_time, max_frames):
+    results = []
+    elapsed = 0.0
+    while len(results) < max_frames and (elapsed < min_time or not results):
+        field.move()
+        start = time.perf_counter()
+        hits = collide()
+        elapsed += time.perf_counter() - start
+        results.append({a.index: [b.index for b in hits[a]] for a in hits})
+    return elapsed / len(results), results
+
+def bench_collisions(args):
+    print(f"{'entities':>9} {'groupcollide ms':>16} {'grid ms':>10} {'speedup':>8}  hits/frame")
+    for count in args.counts:
+        field = CollisionField(count, args.seed)
+        rect_ms, rect_hits = time_frames(
+            field, lambda: pygame.sprite.groupcollide(field.enemies, field.bullets, False, False),
+            args.min_time, args.max_frames)
+
+        # Replay the same frames against the spatial hash
+        field = CollisionField(count, args.seed)
+        grid = sf.SpatialHash(sf.enemy_cell_size())
+        for sprite in field.enemies.sprites() + field.bullets.sprites():
+            grid.insert(sprite)
+
+        def grid_collide():
+            grid.update()
+            return grid.groupcollide(field.enemies, field.bullets, False, False)
+
+        grid_ms, grid_hits = time_frames(field, grid_collide, float('inf'), len(rect_hits))
+        if grid_hits != rect_hits:
+            raise SystemExit(f"Spatial hash results differ from groupcollide at {count} entities")
+
+        hits = sum(len(frame) for frame in rect_hits) / len(rect_hits)
+        print(f"{count:>9} {rect_ms * 1000:>16.3f} {grid_ms * 1000:>10.3f} "
+              f"{rect_ms / grid_ms:>7.1f}x  {hits:.1f}")
+
+# Narrow-phase hit tests. 'rect' and 'mask' are the game's default pairwise
+# groupcollide, without and with its cached-mask check; the grid rows run the
+# same tests behind the spatial hash (--collision grid), and 'uncached' is
+# pygame's own collide_mask, which builds both masks on every call. Each test
+# says whether it needs the grid, so the others don't pay for refiling it.
+HITBOX_TESTS = {
+    'rect': (False, lambda grid, field: pygame.sprite.groupcollide(
+        field.enemies, field.bullets, False, False)),
+    'mask': (False, lambda grid, field: pygame.sprite.groupcollide(
+        field.enemies, field.bullets, False, False, sf.collide_mask)),
+    'grid rect': (True, lambda grid, field: grid.groupcollide(
+        field.enemies, field.bullets, False, False)),
+    'grid mask': (True, lambda grid, field: grid.groupcollide(
+        field.enemies, field.bullets, False, False, sf.masks_overlap)),
+    'uncached': (False, lambda grid, field: pygame.sprite.groupcollide(
+        field.enemies, field.bullets, False, False, pygame.sprite.collide_mask)),
+}
+
+def bench_hitboxes(args):
+    print(f"{'entities':>9} " + " ".join(f"{name + ' ms':>12}" for name in HITBOX_TESTS) +
+          f" {'mask/rect':>10}  rect hits  mask hits")
+    # Run every test once first, so none of them pays for warming up
+    field = CollisionField(100, args.seed)
+    grid = sf.SpatialHash(sf.enemy_cell_size())
+    for sprite in field.enemies.sprites() + field.bullets.sprites():
+        grid.insert(sprite)
+    for uses_grid, collide in HITBOX_TESTS.values():
+        collide(grid, field)
+
+    for count in args.counts:
+        times = {}
+        hits = {}
+        for name, (uses_grid, collide) in HITBOX_TESTS.items():
+            field = CollisionField(count, args.seed)
+            grid = sf.SpatialHash(sf.enemy_cell_size())
+            for sprite in field.enemies.sprites() + field.bullets.sprites():
+                grid.insert(sprite)
+
+            def frame():
+                if uses_grid:
+                    grid.update()
+                return collide(grid, field)
+
+            # Every test runs over the same frames as the first
+            frames = len(hits['rect']) if hits else args.max_frames
+            min_time = args.min_time if not hits else float('inf')
+            times[name], hits[name] = time_frames(field, frame, min_time, frames)
+        if hits['grid rect'] != hits['rect']:
+            raise SystemExit(f"Spatial hash results differ from groupcollide at {count} entities")
+        if not hits['mask'] == hits['grid mask'] == hits['uncached']:
+            raise SystemExit(f"Cached masks differ from collide_mask at {count} entities")
+
+        rect_hits, mask_hits = (sum(map(len, hits[name])) / len(hits[name])
+                                for name in ('rect', 'mask'))
+        print(f"{count:>9} " + " ".join(f"{times[name] * 1000:>12.3f}" for name in HITBOX_TESTS) +
+              f" {times['mask'] / times['rect']:>9.2f}x {rect_hits:>10.1f} {mask_hits:>10.1f}")
+
+# Player that holds down the trigger: fire is pressed every other frame, the
+# fastest a key-driven shot can repeat
+class FirePolicy:
+    def __init__(self):
+        self.pressed = False
+
+    def __call__(self, sim):
+        self.pressed = not self.pressed
+        return [('fire', self.pressed)]
+
+# Scripted workloads for the suite. enemies keeps the enemy count topped up to
+# that many; explosions are set off at random points every frame; a
+# shoot_delay of 0 lets the player fire on every press.
+SCENARIOS = {
+    'easy': {'difficulty': 'easy', 'policy': sf.ChaserPolicy},
+    'normal': {'difficulty': 'normal', 'policy': sf.ChaserPolicy},
+    'hard': {'difficulty': 'hard', 'policy': sf.ChaserPolicy},
+    'enemies-100': {'enemies': 100},
+    'enemies-1k': {'enemies': 1000},
+    'enemies-10k': {'enemies': 10000},
+    'constant-fire': {'policy': FirePolicy, 'shoot_delay': 0},
+    'explosions': {'explosions': 20},
+}
+
+# Frame time percentiles and per-phase medians in milliseconds; allocation
+# figures are per frame
+REPORT_PHASES = ('update', 'collision', 'sprites', 'hud')
+
+class Scenario:
+    def __init__(self, name, seed=0, backend='sprites', renderer='full', collision='rect'):
+        settings = SCENARIOS[name]
+        self.name = name
+        self.enemies = settings.get('enemies', 0)
+        self.explosions = settings.get('explosions', 0)
+        self.policy = settings.get('policy', lambda: sf.idle_policy)()
+        self.sim = sf.Simulation(settings.get('difficulty', 'normal'), seed, backend=backend,
+                                 collision=collision)
+        self.sim.player.shoot_delay = settings.get('shoot_delay', self.sim.player.shoot_delay)
+        self.starfield = sf.Starfield((sf.SCREEN_WIDTH, sf.SCREEN_HEIGHT))
+        if renderer == 'dirty':
+            self.renderer = sf.DirtyRenderer(self.sim.difficulty)
+        else:
+            self.renderer = sf.Renderer(self.sim.difficulty)
+
+    # One pass of the game loop, without the frame cap. The game carries on
+    # after the player runs out of lives so every scenario runs the same length.
+    def frame(self, profiler):
+        sim = self.sim
+        profiler.start_frame()
+        actions = self.policy(sim)
+        profiler.lap('input')
+        while len(sim.enemies) < self.enemies:
+            sim.spawn_enemy()
+        for i in range(self.explosions):
+            center = (sim.rng.randrange(sf.SCREEN_WIDTH), sim.rng.randrange(sf.SCREEN_HEIGHT))
+            sim.explosions.explode(center)
+        profiler.lap('spawn')
+        sim.step(actions)
+        self.starfield.update()
+        profiler.lap('stars')
+        self.renderer.render(sf.screen, sim, self.starfield)
+        profiler.end_frame(sim)
+
+def run_scenario(name, args):
+    scenario = Scenario(name, args.seed, args.backend, args.renderer, args.collision)
+    for i in range(args.warmup):
+        scenario.frame(sf.NULL_PROFILER)
+    
+    # Timed pass
+    profiler = sf.FrameProfiler(args.frames)
+    scenario.sim.profiler = profiler
+    blocks = sys.getallocatedblocks()
+    for i in range(args.frames):
+        scenario.frame(profiler)
+    blocks = (sys.getallocatedblocks() - blocks) / args.frames
+    
+    # Allocation pass: tracing slows everything down, so it is kept out of the
+    # timings. Peak traced memory above the frame's starting point counts the
+    # temporaries a frame churns through, not just what it keeps.
+    scenario.sim.profiler = sf.NULL_PROFILER
+    allocated = 0
+    tracemalloc.start()
+    for i in range(args.alloc_frames):
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        scenario.frame(sf.NULL_PROFILER)
+        allocated += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+    
+    frame_ms = profiler.history('frame')
+    return {
+        **profiler.percentiles('frame'),
+        'mean': sum(frame_ms) / len(frame_ms),
+        'max': max(frame_ms),
+        'phases': {phase: profiler.percentiles(phase)['p50'] for phase in REPORT_PHASES},
+        'alloc_kib': allocated / max(1, args.alloc_frames) / 1024,
+        'blocks': blocks,
+        'enemies': len(scenario.sim.enemies),
+    }
+
+# Change from the baseline as a percentage, or None if there is nothing to compare
+def change(value, base):
+    if not base:
+        return None
+    return (value - base) / base * 100
+
+def bench_suite(args):
+    # Headless displays skip pygame.init(); the HUD needs fonts
+    pygame.font.init()
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    
+    columns = ('p50', 'p95', 'p99', 'max') + REPORT_PHASES
+    print(f"{'scenario':<14} {'enemies':>7} " + " ".join(f"{name:>9}" for name in columns) +
+          f" {'alloc KiB':>9} {'blocks':>7}")
+    results = {}
+    regressions = []
+    for name in args.scenarios:
+        result = results[name] = run_scenario(name, args)
+        values = [result[name] for name in columns[:4]] + [result['phases'][phase]
+                                                             for phase in REPORT_PHASES]
+        print(f"{name:<14} {result['enemies']:>7} " + " ".join(f"{value:>9.3f}" for value in values) +
+              f" {result['alloc_kib']:>9.1f} {result['blocks']:>7.1f}")
+        
+        base = baseline.get(name) if baseline else None
+        if base:
+            compared = [('p50', result['p50'], base['p50']), ('p95', result['p95'], base['p95'])]
+            compared += [(phase, result['phases'][phase], base['phases'][phase])
+                         for phase in REPORT_PHASES]
+            compared.append(('alloc KiB', result['alloc_kib'], base['alloc_kib']))
+            changes = [(label, change(value, old)) for label, value, old in compared]
+            print(f"{'':<14} vs baseline: " +
+                  ", ".join(f"{label} {pct:+.0f}%" for label, pct in changes if pct is not None))
+            regressions += [f"{name} {label} {pct:+.0f}%" for label, pct in changes
+                            if pct is not None and pct > args.tolerance * 100]
+    
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=1)
+        print(f"Baseline written to {args.save_baseline}")
+    if regressions:
+        raise SystemExit("Slower than the baseline: " + "; ".join(regressions))
+
+# One run of the normal game with steps simulation steps per render, as the
+# main loop does when it falls behind. Returns the mean render time in
+# milliseconds and a checksum of the screen after every render.
+def render_run(renderer_class, steps, args):
+    sim = sf.Simulation('normal', args.seed)
+    starfield = sf.Starfield((sf.SCREEN_WIDTH, sf.SCREEN_HEIGHT), random.Random(args.seed))
+    renderer = renderer_class(sim.difficulty)
+    policy = sf.ChaserPolicy()
+    elapsed = 0.0
+    checksums = []
+    for i in range(args.renders):
+        for step in range(steps):
+            renderer.remember(sim)
+            sim.step(policy(sim))
+            starfield.update()
+        start = time.perf_counter()
+        renderer.render(sf.screen, sim, starfield)
+        elapsed += time.perf_counter() - start
+        checksums.append(zlib.crc32(pygame.image.tobytes(sf.screen, 'RGB')))
+    return elapsed / args.renders * 1000, checksums, renderer
+
+def bench_renderers(args):
+    pygame.font.init()
+    print(f"{'steps':>5} {'full ms':>8} {'dirty ms':>9} {'dirty frames':>13}")
+    for steps in args.steps:
+        full_ms, full, renderer = render_run(sf.Renderer, steps, args)
+        dirty_ms, dirty, renderer = render_run(sf.DirtyRenderer, steps, args)
+        if dirty != full:
+            frame = next(i for i, (a, b) in enumerate(zip(full, dirty)) if a != b)
+            raise SystemExit(f"Dirty renderer differs from the full one at render {frame} "
+                             f"with {steps} steps per render")
+        share = renderer.dirty_frames / (renderer.dirty_frames + renderer.full_frames)
+        print(f"{steps:>5} {full_ms:>8.3f} {dirty_ms:>9.3f} {share:>12.0%}")
+
+# The two ways of keeping short-lived entities: Bullet sprites in a Group
+# (what bullets use) against particles in a ParticleSystem. Each returns an
+# object with update() and a function that creates one entity.
+def sprite_entities(sim):
+    group = pygame.sprite.Group()
+    def create():
+        group.add(sf.Bullet(400, 300))
+    return group, create
+
+def particle_entities(sim):
+    particles = sf.ParticleSystem(sim)
+    def create():
+        particles.emit('debris', (400, 300), (1.0, -2.0))
+    return particles, create
+
+ENTITY_KINDS = {
+    'sprite': sprite_entities,
+    'particle': particle_entities,
+}
+
+def bench_particles(args):
+    sim = sf.Simulation('normal', args.seed)
+    print(f"{'kind':<9} {'count':>7} {'bytes/entity':>13} {'creations/s':>12} {'update us/1k':>13}")
+    for count in args.counts:
+        for kind, make in ENTITY_KINDS.items():
+            # Creation rate, untraced
+            entities, create = make(sim)
+            start = time.perf_counter()
+            for i in range(count):
+                create()
+            rate = count / (time.perf_counter() - start)
+            start = time.perf_counter()
+            for i in range(args.updates):
+                entities.update()
+            update_us = (time.perf_counter() - start) / args.updates / count * 1e6 * 1000
+            del entities, create
+
+            # Memory: everything a new entity allocates, bookkeeping included
+            tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+            entities, create = make(sim)
+            for i in range(count):
+                create()
+            size = (tracemalloc.get_traced_memory()[0] - before) / count
+            tracemalloc.stop()
+            del entities, create
+            print(f"{kind:<9} {count:>7} {size:>13.0f} {rate:>12.0f} {update_us:>13.1f}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Space Shooter benchmarks")
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    collisions = subparsers.add_parser(
+        'collisions', help="spatial hash against groupcollide for bullet/enemy checks")
+    collisions.add_argument('--counts', type=int, nargs='+', default=ENTITY_COUNTS,
+                            help="enemy counts to test")
+    collisions.add_argument('--seed', type=int, default=0)
+    collisions.add_argument('--min-time', type=float, default=0.5,
+                            help="seconds to spend per entity count")
+    collisions.add_argument('--max-frames', type=int, default=200)
+    collisions.set_defaults(run=bench_collisions)
+
+    hitboxes = subparsers.add_parser(
+        'hitboxes', help="cost of pixel-mask hit tests against rect-only collisions")
+    hitboxes.add_argument('--counts', type=int, nargs='+', default=(10, 100, 1000),
+                          help="enemy counts to test")
+    hitboxes.add_argument('--seed', type=int, default=0)
+    hitboxes.add_argument('--min-time', type=float, default=0.5,
+                          help="seconds to spend on rect tests per entity count")
+    hitboxes.add_argument('--max-frames', type=int, default=200)
+    hitboxes.set_defaults(run=bench_hitboxes)
+
+    suite = subparsers.add_parser(
+        'suite', help="frame times and allocations of the full game loop in scripted scenarios")
+    suite.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    suite.add_argument('--seed', type=int, default=0)
+    suite.add_argument('--frames', type=int, default=300, help="timed frames per scenario")
+    suite.add_argument('--warmup', type=int, default=30,
+                       help="frames run before timing, to fill pools and caches")
+    suite.add_argument('--alloc-frames', type=int, default=30,
+                       help="frames run with allocation tracing after the timed ones")
+    suite.add_argument('--backend', choices=('sprites', 'numpy'), default='sprites')
+    suite.add_argument('--renderer', choices=('full', 'dirty'), default='full')
+    suite.add_argument('--collision', choices=('grid', 'rect'), default='rect')
+    suite.add_argument('--baseline', metavar='FILE', help="results to compare against")
+    suite.add_argument('--save-baseline', metavar='FILE', help="write the results as a baseline")
+    suite.add_argument('--tolerance', type=float, default=0.1,
+                       help="slowdown against the baseline, as a fraction, that fails the run")
+    suite.set_defaults(run=bench_suite)
+
+    renderers = subparsers.add_parser(
+        'renderers', help="dirty-rect rendering against full redraws, checked pixel for pixel")
+    renderers.add_argument('--steps', type=int, nargs='+', default=(1, 2, 3, 5),
+                           help="simulation steps per render to test")
+    renderers.add_argument('--renders', type=int, default=300)
+    renderers.add_argument('--seed', type=int, default=0)
+    renderers.set_defaults(run=bench_renderers)
+
+    particles = subparsers.add_parser(
+        'particles', help="memory and creation rate of sprites against particle records")
+    particles.add_argument('--counts', type=int, nargs='+', default=(1000, 10000, 100000))
+    particles.add_argument('--updates', type=int, default=20, help="updates timed per count")
+    particles.add_argument('--seed', type=int, default=0)
+    particles.set_defaults(run=bench_particles)
+
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    sf.init_display(headless=True)
+    args.run(args)
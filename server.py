@@ -0,0 +1,571 @@
+import argparse
+import asyncio
+import itertools
+import multiprocessing
+import statistics
+import struct
+import time
+from collections import OrderedDict
+
+import spacefighter as sf
+
+DEFAULT_PORT = 7777
+SNAPSHOT_HISTORY = 64  # snapshots kept on both ends as delta baselines
+MAX_BUFFERED = 64 * 1024  # unsent bytes a client may have before its snapshots are skipped
+MAX_BEHIND = 10  # ticks the server catches up after a stall before giving up on them
+MAX_INPUTS = 8  # inputs one client may queue per tick; the rest are dropped
+
+# Wire format (little endian). Every message is a uint16 body length and a
+# type byte, then the body:
+#   JOIN      client -> server: nothing; joins the next room to start
+#   INPUT     client -> server: uint32 sequence number, action code (the
+#             ACTIONS index, with bit 3 set for presses, as in recordings)
+#   ACK       client -> server: uint32 tick of the newest snapshot received
+#   WELCOME   server -> client: uint32 room, uint8 player index, uint8
+#             players, uint16 ticks per second, uint8 ticks per snapshot
+#   SNAPSHOT  server -> client: uint32 tick, uint32 baseline tick (0 for a
+#             full snapshot), uint32 newest input sequence applied, then the
+#             state as a delta from the baseline (see encode_delta)
+#   GAME_OVER server -> client: uint32 score, uint32 kills, uint32 ticks
+FRAME = struct.Struct('<HB')
+JOIN, INPUT, ACK, WELCOME, SNAPSHOT, GAME_OVER = range(6)
+INPUT_BODY = struct.Struct('<IB')
+ACK_BODY = struct.Struct('<I')
+WELCOME_BODY = struct.Struct('<IBBHB')
+SNAPSHOT_HEADER = struct.Struct('<III')
+GAME_OVER_BODY = struct.Struct('<III')
+
+# Snapshot state: score, then each player's entity id and lives, then the
+# entities that changed since the baseline. Entities are every sprite in the
+# world, keyed by an id that is never reused, with their kind, position and
+# velocity in pixels per tick; explosions are left for clients to play where
+# enemies disappear.
+KINDS = ('player', 'enemy', 'special', 'bullet', 'powerup')
+STATE_HEADER = struct.Struct('<IB')
+PLAYER = struct.Struct('<IB')
+COUNT = struct.Struct('<H')
+REMOVED = struct.Struct('<I')
+ADDED = struct.Struct('<IBhhbb')
+CORRECTED = struct.Struct('<Ihhbb')
+
+# A client sent something that is not valid protocol; it is disconnected
+class ProtocolError(Exception):
+    pass
+
+def message(kind, body=b''):
+    return FRAME.pack(len(body), kind) + body
+
+async def read_message(reader):
+    length, kind = FRAME.unpack(await reader.readexactly(FRAME.size))
+    return kind, await reader.readexactly(length)
+
+# Where the baseline says an entity should be ticks later, if it kept moving
+def predict(entity, ticks):
+    kind, x, y, vx, vy = entity
+    return (kind, x + vx * ticks, y + vy * ticks, vx, vy)
+
+# Encode a state {id: (kind, x, y, vx, vy)} as the changes from base, a
+# state ticks older: entities gone, entities new, and corrections for the
+# rest where they are not where their baseline velocity puts them. Enemies,
+# bullets and power-ups fly straight, so most entities cost nothing and a
+# delta is a fraction of a full snapshot (a delta from {}).
+def encode_delta(score, players, state, base, ticks):
+    removed = [REMOVED.pack(entity) for entity in base if entity not in state]
+    added = []
+    corrected = []
+    for entity, values in state.items():
+        old = base.get(entity)
+        if old is None:
+            added.append(ADDED.pack(entity, *values))
+        elif predict(old, ticks) != values:
+            corrected.append(CORRECTED.pack(entity, *values[1:]))
+    parts = [STATE_HEADER.pack(score, len(players))]
+    parts.extend(PLAYER.pack(*player) for player in players)
+    for records in (removed, added, corrected):
+        parts.append(COUNT.pack(len(records)))
+        parts.extend(records)
+    return b''.join(parts)
+
+# Rebuild the state a delta was encoded from, given its baseline and the
+# ticks between them. Returns the score, the players as (id, lives) and the
+# state.
+def decode_delta(data, offset, base, ticks):
+    score, count = STATE_HEADER.unpack_from(data, offset)
+    offset += STATE_HEADER.size
+    players = list(PLAYER.iter_unpack(data[offset:offset + count * PLAYER.size]))
+    offset += count * PLAYER.size
+
+    sections = []
+    for record in (REMOVED, ADDED, CORRECTED):
+        count, = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        sections.append(record.iter_unpack(data[offset:offset + count * record.size]))
+        offset += count * record.size
+    removed, added, corrected = sections
+    state = {entity: predict(values, ticks) for entity, values in base.items()}
+    for entity, in removed:
+        del state[entity]
+    for entity, *values in added:
+        state[entity] = tuple(values)
+    for entity, *values in corrected:
+        state[entity] = (state[entity][0], *values)
+    return score, players, state
+
+# Simulation that gives every entity a network id and kind when it enters
+# the world. Pooled sprites get a new id each time they are reused.
+class NetSimulation(sf.Simulation):
+    def __init__(self, *args, **kwargs):
+        self.net_ids = itertools.count(1)
+        super().__init__(*args, **kwargs)
+        for player in self.players:
+            self.tag(player, KINDS.index('player'))
+
+    def tag(self, sprite, kind):
+        sprite.net_id = next(self.net_ids)
+        sprite.net_kind = kind
+
+    def add(self, sprite, group):
+        sprite = super().add(sprite, group)
+        if group is self.enemies:
+            kind = 'special' if sprite.enemy_type == 'special' else 'enemy'
+        elif group is self.bullets:
+            kind = 'bullet'
+        else:
+            kind = 'powerup'
+        self.tag(sprite, KINDS.index(kind))
+        return sprite
+
+    def state(self):
+        return {sprite.net_id: (sprite.net_kind, sprite.rect.x, sprite.rect.y,
+                                getattr(sprite, 'speedx', 0), sprite.speedy)
+                for sprite in self.all_sprites}
+
+# One client connection on the server
+class Connection:
+    def __init__(self, writer):
+        self.writer = writer
+        self.room = None
+        self.index = 0  # player index in the room
+        self.acked = 0  # newest snapshot tick the client has, 0 for none
+        self.input_seq = 0  # newest input applied
+        self.queued = 0  # inputs queued for the next tick
+
+    def send(self, data):
+        self.writer.write(data)
+
+    # A client that stops reading would otherwise buffer without limit
+    def backed_up(self):
+        return self.writer.transport.get_write_buffer_size() > MAX_BUFFERED
+
+# A game in progress: one authoritative simulation, stepped every tick, with
+# the players' queued inputs applied in the order they arrived
+class Room:
+    def __init__(self, server, number, connections, seed):
+        self.server = server
+        self.number = number
+        self.connections = connections
+        self.sim = NetSimulation(server.difficulty, seed, hitbox=server.hitbox,
+                                 players=len(connections))
+        self.inputs = []
+        self.history = OrderedDict()  # tick -> state, oldest first
+        for index, connection in enumerate(connections):
+            connection.room = self
+            connection.index = index
+            connection.acked = 0
+            connection.send(message(WELCOME, WELCOME_BODY.pack(
+                number, index, len(connections), sf.FPS, server.snapshot_every)))
+
+    def tick(self):
+        sim = self.sim
+        actions, self.inputs = self.inputs, []
+        for connection in self.connections:
+            connection.queued = 0
+        sim.step(actions)
+        if sim.frame % self.server.snapshot_every == 0 or sim.game_over:
+            self.send_snapshot()
+        if sim.game_over:
+            self.finish()
+
+    # Each client gets a delta from the newest snapshot it acknowledged, or a
+    # full snapshot if it has none still kept; clients with the same
+    # baseline share one encoding
+    def send_snapshot(self):
+        sim = self.sim
+        tick = sim.frame
+        state = sim.state()
+        self.history[tick] = state
+        while len(self.history) > SNAPSHOT_HISTORY:
+            self.history.popitem(last=False)
+        players = [(player.net_id, max(0, player.lives)) for player in sim.players]
+
+        stats = self.server.stats
+        encoded = {}
+        for connection in self.connections:
+            if connection.backed_up():
+                stats['skipped'] += 1
+                continue
+            baseline = connection.acked if connection.acked in self.history else 0
+            body = encoded.get(baseline)
+            if body is None:
+                body = encoded[baseline] = encode_delta(
+                    sim.score, players, state, self.history[baseline] if baseline else {},
+                    tick - baseline)
+            data = message(SNAPSHOT, SNAPSHOT_HEADER.pack(tick, baseline, connection.input_seq) +
+                           body)
+            connection.send(data)
+            stats['snapshots'] += 1
+            stats['full'] += not baseline
+            stats['bytes'] += len(data)
+        # What full snapshots would have cost, for the compression ratio
+        stats['full_bytes'] += (len(self.connections) *
+                                (FRAME.size + SNAPSHOT_HEADER.size + STATE_HEADER.size +
+                                 len(players) * PLAYER.size + 3 * COUNT.size +
+                                 len(state) * ADDED.size))
+
+    def finish(self):
+        sim = self.sim
+        data = message(GAME_OVER, GAME_OVER_BODY.pack(sim.score, sim.kills, int(sim.ticks)))
+        for connection in self.connections:
+            connection.send(data)
+            connection.room = None
+        self.connections = []
+        self.server.stats['games'] += 1
+
+    # A player who leaves is out of the game; the room closes with the last one
+    def leave(self, connection):
+        self.connections.remove(connection)
+        player = self.sim.players[connection.index]
+        player.lives = 0
+        player.kill()
+        connection.room = None
+
+    @property
+    def finished(self):
+        return not self.connections
+
+# Authoritative game server: accepts clients, groups them into rooms and
+# steps every room from a single fixed-rate tick loop, so one process serves
+# as many rooms as fit in a tick
+class Server:
+    def __init__(self, difficulty='normal', hitbox='mask', room_size=2, lobby_wait=2.0,
+                 snapshot_every=2, seed=0):
+        self.difficulty = difficulty
+        self.hitbox = hitbox
+        self.room_size = room_size
+        self.lobby_wait = lobby_wait
+        self.snapshot_every = snapshot_every
+        self.seed = seed
+        self.rooms = []
+        self.room_numbers = itertools.count(1)
+        self.lobby = []  # connections waiting for a room
+        self.lobby_since = 0.0
+        self.connections = set()
+        self.tick_ms = []  # time spent in each tick since the last report
+        self.stats = dict.fromkeys(('ticks', 'overruns', 'snapshots', 'full', 'skipped', 'bytes',
+                                    'full_bytes', 'bytes_in', 'games', 'rejected'), 0)
+
+    async def start(self, host, port):
+        sf.init_display(headless=True)
+        self.listener = await asyncio.start_server(self.serve_client, host, port)
+        self.ticker = asyncio.create_task(self.run_ticks())
+
+    async def serve_client(self, reader, writer):
+        connection = Connection(writer)
+        self.connections.add(connection)
+        try:
+            while True:
+                kind, body = await read_message(reader)
+                self.stats['bytes_in'] += FRAME.size + len(body)
+                if kind == INPUT:
+                    if len(body) != INPUT_BODY.size:
+                        raise ProtocolError("bad INPUT length")
+                    seq, code = INPUT_BODY.unpack(body)
+                    action = code & ~sf.REPLAY_PRESSED
+                    if action >= len(sf.ACTIONS):
+                        raise ProtocolError(f"bad action code {code}")
+                    if connection.room and connection.queued < MAX_INPUTS:
+                        connection.room.inputs.append((sf.ACTIONS[action],
+                                                       bool(code & sf.REPLAY_PRESSED),
+                                                       connection.index))
+                        connection.queued += 1
+                        connection.input_seq = seq
+                elif kind == ACK:
+                    if len(body) != ACK_BODY.size:
+                        raise ProtocolError("bad ACK length")
+                    connection.acked, = ACK_BODY.unpack(body)
+                elif kind == JOIN:
+                    if body:
+                        raise ProtocolError("bad JOIN length")
+                    if connection.room is None and connection not in self.lobby:
+                        if not self.lobby:
+                            self.lobby_since = time.perf_counter()
+                        self.lobby.append(connection)
+                else:
+                    raise ProtocolError(f"unknown message type {kind}")
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except ProtocolError:
+            self.stats['rejected'] += 1
+        finally:
+            self.connections.discard(connection)
+            if connection.room:
+                connection.room.leave(connection)
+            if connection in self.lobby:
+                self.lobby.remove(connection)
+            writer.close()
+
+    # Start a room whenever the lobby is full, or has waited long enough
+    def start_rooms(self):
+        while len(self.lobby) >= self.room_size or (
+                self.lobby and time.perf_counter() - self.lobby_since > self.lobby_wait):
+            connections = self.lobby[:self.room_size]
+            del self.lobby[:self.room_size]
+            number = next(self.room_numbers)
+            self.rooms.append(Room(self, number, connections, self.seed + number))
+            self.lobby_since = time.perf_counter()
+
+    async def run_ticks(self):
+        loop = asyncio.get_running_loop()
+        tick_s = 1 / sf.FPS
+        deadline = loop.time()
+        while True:
+            start = time.perf_counter()
+            self.start_rooms()
+            for room in self.rooms:
+                if not room.finished:  # everyone may have left since the last tick
+                    room.tick()
+            self.rooms = [room for room in self.rooms if not room.finished]
+            self.tick_ms.append((time.perf_counter() - start) * 1000)
+            self.stats['ticks'] += 1
+
+            deadline += tick_s
+            delay = deadline - loop.time()
+            if delay < 0:
+                self.stats['overruns'] += 1
+                if delay < -tick_s * MAX_BEHIND:
+                    deadline = loop.time()
+            await asyncio.sleep(max(0.0, delay))
+
+    # One line of load and bandwidth figures for the time since the last one
+    def report(self, seconds):
+        stats = self.stats
+        tick_ms = sorted(self.tick_ms) or [0.0]
+        self.tick_ms = []
+        ratio = stats['bytes'] / stats['full_bytes'] if stats['full_bytes'] else 0.0
+        print(f"{len(self.rooms)} rooms, {len(self.connections)} clients: "
+              f"{stats['ticks'] / seconds:.0f} ticks/s, tick p50 {tick_ms[len(tick_ms) // 2]:.2f} ms "
+              f"p99 {tick_ms[len(tick_ms) * 99 // 100]:.2f} ms, {stats['overruns']} overruns, "
+              f"{stats['bytes'] / seconds / 1024:.1f} KiB/s out "
+              f"({ratio:.0%} of full snapshots, {stats['full']} full), "
+              f"{stats['bytes_in'] / seconds / 1024:.1f} KiB/s in, "
+              f"{stats['skipped']} skipped, {stats['games']} games over, "
+              f"{stats['rejected']} clients rejected", flush=True)
+        for name in stats:
+            stats[name] = 0
+
+    async def close(self):
+        self.ticker.cancel()
+        self.listener.close()
+        for connection in list(self.connections):
+            connection.writer.close()
+        await self.listener.wait_closed()
+
+async def serve(args, duration=None):
+    server = Server(args.difficulty, args.hitbox, args.room_size, args.lobby_wait,
+                    args.snapshot_every, args.seed)
+    await server.start(args.host, args.port)
+    print(f"Serving on {args.host}:{args.port}, {args.room_size} players per room, "
+          f"{sf.FPS} ticks/s, a snapshot every {args.snapshot_every} ticks", flush=True)
+    last = time.perf_counter()
+    end = last + duration if duration else float('inf')
+    while last < end:
+        await asyncio.sleep(min(args.report, end - last))
+        now = time.perf_counter()
+        server.report(now - last)
+        last = now
+    await server.close()
+
+# Scripted client: keeps its ship under the lowest enemy and holds down the
+# trigger, like ChaserPolicy, but seeing the world only through snapshots.
+# Measures bandwidth, snapshot spacing and input latency: the time from
+# sending an input to receiving the first snapshot that includes it.
+class Bot:
+    def __init__(self, stats):
+        self.stats = stats
+        self.snapshots = OrderedDict()  # tick -> state, as baselines
+        self.index = 0
+        self.seq = 0
+        self.sent = {}  # input sequence -> send time
+        self.moving = None
+        self.firing = False
+        self.last_arrival = None
+
+    async def run(self, host, port, end):
+        reader, writer = await asyncio.open_connection(host, port)
+        self.writer = writer
+        self.send(message(JOIN))
+        try:
+            while time.perf_counter() < end:
+                kind, body = await read_message(reader)
+                self.stats['bytes_in'] += FRAME.size + len(body)
+                if kind == SNAPSHOT:
+                    self.on_snapshot(body)
+                elif kind == WELCOME:
+                    room, self.index, players, tick_rate, snapshot_every = \
+                        WELCOME_BODY.unpack(body)
+                    self.snapshots.clear()
+                elif kind == GAME_OVER:
+                    self.stats['games'] += 1
+                    self.sent.clear()
+                    self.moving = None
+                    self.firing = False
+                    self.last_arrival = None
+                    self.send(message(JOIN))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            self.stats['dropped'] += 1
+        writer.close()
+
+    def send(self, data):
+        self.stats['bytes_out'] += len(data)
+        self.writer.write(data)
+
+    def on_snapshot(self, body):
+        now = time.perf_counter()
+        tick, baseline, input_seq = SNAPSHOT_HEADER.unpack_from(body)
+        score, players, state = decode_delta(body, SNAPSHOT_HEADER.size,
+                                             self.snapshots[baseline] if baseline else {},
+                                             tick - baseline)
+        self.snapshots[tick] = state
+        while len(self.snapshots) > SNAPSHOT_HISTORY:
+            self.snapshots.popitem(last=False)
+        self.send(message(ACK, ACK_BODY.pack(tick)))
+
+        stats = self.stats
+        stats['snapshots'] += 1
+        stats['full'] += not baseline
+        if self.last_arrival is not None:
+            stats['intervals'].append((now - self.last_arrival) * 1000)
+        self.last_arrival = now
+        for seq in [seq for seq in self.sent if seq <= input_seq]:
+            stats['latency'].append((now - self.sent.pop(seq)) * 1000)
+
+        player, lives = players[self.index]
+        if player in state and lives > 0:
+            self.act(state, state[player])
+
+    def act(self, state, ship):
+        enemy_kinds = (KINDS.index('enemy'), KINDS.index('special'))
+        enemies = [entity for entity in state.values() if entity[0] in enemy_kinds]
+        moving = None
+        if enemies:
+            target = max(enemies, key=lambda entity: entity[2])
+            dx = target[1] - ship[1]
+            if abs(dx) > 8:
+                moving = 'right' if dx > 0 else 'left'
+        if moving != self.moving:
+            if self.moving:
+                self.input(self.moving, False)
+            if moving:
+                self.input(moving, True)
+            self.moving = moving
+        self.firing = not self.firing
+        self.input('fire', self.firing)
+
+    def input(self, action, pressed):
+        self.seq += 1
+        self.sent[self.seq] = time.perf_counter()
+        code = sf.ACTIONS.index(action) | (sf.REPLAY_PRESSED if pressed else 0)
+        self.send(message(INPUT, INPUT_BODY.pack(self.seq, code)))
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, len(values) * p // 100)] if values else 0.0
+
+async def run_bots(args):
+    stats = {'bytes_in': 0, 'bytes_out': 0, 'snapshots': 0, 'full': 0, 'games': 0,
+             'dropped': 0, 'latency': [], 'intervals': []}
+    start = time.perf_counter()
+    end = start + args.duration
+    bots = []
+    for i in range(args.clients):
+        bots.append(asyncio.create_task(Bot(stats).run(args.host, args.port, end)))
+    await asyncio.gather(*bots)
+    elapsed = time.perf_counter() - start
+
+    clients = args.clients
+    print(f"{clients} bots for {elapsed:.1f}s: {stats['snapshots'] / elapsed / clients:.1f} "
+          f"snapshots/s each ({stats['full']} full), {stats['games']} games over, "
+          f"{stats['dropped']} disconnected")
+    print(f"Bandwidth per client: {stats['bytes_in'] / elapsed / clients / 1024:.2f} KiB/s down, "
+          f"{stats['bytes_out'] / elapsed / clients / 1024:.2f} KiB/s up, "
+          f"{stats['bytes_in'] / max(1, stats['snapshots']):.0f} bytes per snapshot")
+    print(f"Input latency: p50 {percentile(stats['latency'], 50):.1f} ms, "
+          f"p95 {percentile(stats['latency'], 95):.1f} ms, "
+          f"p99 {percentile(stats['latency'], 99):.1f} ms")
+    print(f"Snapshot spacing: mean {statistics.mean(stats['intervals'] or [0]):.1f} ms, "
+          f"p99 {percentile(stats['intervals'], 99):.1f} ms", flush=True)
+
+def main_serve(args):
+    asyncio.run(serve(args))
+
+def main_bots(args):
+    asyncio.run(run_bots(args))
+
+def main_load_test(args):
+    asyncio.run(load_test(args))
+
+# Server and bots on localhost, the bots in their own process so they do not
+# share the server's tick loop
+async def load_test(args):
+    args.clients = args.rooms * args.room_size
+    server_task = asyncio.create_task(serve(args, args.duration + 2))
+    await asyncio.sleep(0.5)
+    bots = multiprocessing.get_context('spawn').Process(target=main_bots, args=(args,))
+    bots.start()
+    await asyncio.get_running_loop().run_in_executor(None, bots.join)
+    await server_task
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Space Shooter co-op server and load-test bots")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_server_args(command):
+        command.add_argument('--difficulty', choices=sf.DIFFICULTY, default='normal')
+        command.add_argument('--hitbox', choices=sf.HITBOXES, default='mask')
+        command.add_argument('--room-size', type=int, default=2, help="players per room")
+        command.add_argument('--lobby-wait', type=float, default=2.0,
+                             help="seconds before a room starts without all its players")
+        command.add_argument('--snapshot-every', type=int, default=2,
+                             help="ticks between snapshots (the server ticks %d times a second)"
+                                  % sf.FPS)
+        command.add_argument('--seed', type=int, default=0, help="seed of the first room")
+        command.add_argument('--report', type=float, default=5.0,
+                             help="seconds between load reports")
+
+    def add_address_args(command):
+        command.add_argument('--host', default='127.0.0.1')
+        command.add_argument('--port', type=int, default=DEFAULT_PORT)
+
+    server = subparsers.add_parser('serve', help="run the server")
+    add_address_args(server)
+    add_server_args(server)
+    server.set_defaults(run=main_serve)
+
+    bots = subparsers.add_parser('bots', help="connect scripted clients to a running server")
+    add_address_args(bots)
+    bots.add_argument('--clients', type=int, default=20)
+    bots.add_argument('--duration', type=float, default=30.0, help="seconds to play for")
+    bots.set_defaults(run=main_bots)
+
+    load = subparsers.add_parser('loadtest', help="a server and bots filling rooms on localhost")
+    add_address_args(load)
+    add_server_args(load)
+    load.add_argument('--rooms', type=int, default=20, help="rooms the bots fill")
+    load.add_argument('--duration', type=float, default=20.0, help="seconds to play for")
+    load.set_defaults(run=main_load_test)
+
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    args.run(args)
@@ -1,12 +1,29 @@
+import time
+STARTED = time.perf_counter()  # for the cold-start report
+
 import pygame
 import random
 import sys
 import os
+import argparse
+import json
+import csv
+import struct
+import heapq
+import math
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
-# Initialize pygame
-pygame.init()
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # Game constants
+# Logical world resolution. The simulation, sprites and HUD always work at
+# this size; the window shows a scaled copy of it (see Viewport).
 SCREEN_WIDTH = 800
 SCREEN_HEIGHT = 600
 FPS = 60
@@ -25,38 +42,219 @@ DIFFICULTY = {
         'special_enemy_chance': 0.05,
         'enemy_speed_range': (1, 3),
         'enemy_count': 4,
-        'life_powerup_chance': 0.001  # 0.1% chance per frame
+        'life_powerup_chance': 0.001,  # 0.1% chance per frame
+        'enemy_budget': 12,  # most enemies alive at once
+        'wave_interval': 30,  # seconds between enemy waves
+        'wave_size': 4,
     },
     'normal': {
         'enemy_spawn_rate': 0.02,
         'special_enemy_chance': 0.1,
         'enemy_speed_range': (1, 4),
         'enemy_count': 8,
-        'life_powerup_chance': 0.0007  # 0.07% chance per frame
+        'life_powerup_chance': 0.0007,  # 0.07% chance per frame
+        'enemy_budget': 24,
+        'wave_interval': 20,
+        'wave_size': 6,
     },
     'hard': {
         'enemy_spawn_rate': 0.03,
         'special_enemy_chance': 0.15,
         'enemy_speed_range': (2, 5),
         'enemy_count': 10,
-        'life_powerup_chance': 0.0005  # 0.05% chance per frame
+        'life_powerup_chance': 0.0005,  # 0.05% chance per frame
+        'enemy_budget': 32,
+        'wave_interval': 15,
+        'wave_size': 8,
     }
 }
 
 # Current difficulty
 current_difficulty = 'normal'
 
-# Create the game window
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.RESIZABLE)
-pygame.display.set_caption("Space Shooter")
-clock = pygame.time.Clock()
+# The game window is created by init_display() so the module can be imported.
+# screen is the world-sized surface everything draws on; the viewport copies
+# it to the window.
+screen = None
+viewport = None
+clock = None
 
-# Load assets
-def load_image(name, size=None, colorkey=None):
+# Initialize pygame and create the game window
+def init_display(headless=False):
+    global screen, viewport, clock
+    if headless:
+        # The dummy driver gives convert_alpha() a pixel format without a window
+        if not pygame.display.get_init():
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+            pygame.display.init()
+        if pygame.display.get_surface() is None:
+            viewport = Viewport((SCREEN_WIDTH, SCREEN_HEIGHT))
+    else:
+        # Only what the game uses: no audio, joystick or other subsystems
+        pygame.display.init()
+        pygame.font.init()
+        viewport = Viewport((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.RESIZABLE)
+        pygame.display.set_caption("Space Shooter")
+    screen = viewport.surface
+    clock = pygame.time.Clock()
+
+# Render scaling stage: frames are drawn at the world resolution and shown
+# scaled to fit the window, letterboxed, with one scaled blit. When the world
+# fits unscaled, frames are drawn straight into the window instead. A resize
+# only refits the viewport; nothing drawn at world size has to be rebuilt.
+class Viewport:
+    def __init__(self, size, flags=0):
+        self.flags = flags
+        self.surface = None  # what frames are drawn on
+        self.buffer = None  # offscreen world-sized surface, made on first use
+        self.resize(size)
+
+    # Open the window at a new size and fit the world into it, keeping its
+    # aspect ratio and the frame currently shown
+    def resize(self, size):
+        frame = self.surface.copy() if self.surface else None
+        window = self.window = pygame.display.set_mode(size, self.flags)
+        width, height = window.get_size()
+        scale = min(width / SCREEN_WIDTH, height / SCREEN_HEIGHT)
+        self.rect = pygame.Rect(0, 0, max(1, round(SCREEN_WIDTH * scale)),
+                                max(1, round(SCREEN_HEIGHT * scale)))
+        self.rect.center = (width // 2, height // 2)
+        self.rect = self.rect.clip(window.get_rect())
+        self.target = window.subsurface(self.rect)
+        self.scaled = self.rect.size != (SCREEN_WIDTH, SCREEN_HEIGHT)
+        if self.scaled:
+            if self.buffer is None:
+                self.buffer = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT)).convert()
+            self.surface = self.buffer
+        else:
+            self.surface = self.target
+        window.fill(BLACK)
+        if frame:
+            self.surface.blit(frame, (0, 0))
+        self.present()
+        pygame.display.flip()
+
+    # Show the frame. dirty limits the update to the areas that changed, in
+    # world coordinates, when nothing has to be scaled.
+    def present(self, dirty=None):
+        if self.scaled:
+            pygame.transform.scale(self.surface, self.rect.size, self.target)
+            pygame.display.update(self.rect)
+        elif dirty is None:
+            pygame.display.update(self.rect)
+        else:
+            pygame.display.update([rect.move(self.rect.topleft) for rect in dirty])
+
+ASSETS_DIR = 'assets'
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif')
+
+# Asset cache: decodes each file once and keeps scaled copies in a bounded LRU
+class AssetCache:
+    def __init__(self, max_scaled=64):
+        self.max_scaled = max_scaled
+        self.decoded = {}  # name -> converted surface, or (error type, message)
+        self.scaled = OrderedDict()  # (name, size, colorkey) -> scaled surface, or error
+        self.pending = {}  # name -> future of a background decode
+        self.executor = None
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+        self.preloaded = 0
+        self.preload_started = self.preload_finished = None
+
+    # Start decoding every image in ASSETS_DIR on a thread pool. File reads and
+    # decoding happen off the main thread; the display-dependent
+    # convert_alpha() is left to finish_preload() or the first decode().
+    def preload(self, workers=4):
+        if not os.path.isdir(ASSETS_DIR):
+            return
+        names = [name for name in sorted(os.listdir(ASSETS_DIR))
+                 if name.lower().endswith(IMAGE_EXTENSIONS) and name not in self.decoded]
+        if not names:
+            return
+        self.preload_started = time.perf_counter()
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='assets')
+        for name in names:
+            self.pending[name] = self.executor.submit(pygame.image.load,
+                                                      os.path.join(ASSETS_DIR, name))
+
+    # Convert preloaded images that are ready, or all of them with wait set.
+    # Cheap enough to call every frame of a menu.
+    def finish_preload(self, wait=False):
+        for name, future in list(self.pending.items()):
+            if wait or future.done():
+                self.store(name, future)
+        if not self.pending and self.executor:
+            self.executor.shutdown()
+            self.executor = None
+            self.preload_finished = time.perf_counter()
+
+    def store(self, name, future):
+        del self.pending[name]
+        self.loads += 1
+        self.preloaded += 1
+        try:
+            self.decoded[name] = future.result().convert_alpha()
+        except (pygame.error, FileNotFoundError) as e:
+            self.decoded[name] = (type(e), str(e))
+
+    def decode(self, name):
+        if name in self.pending:
+            self.store(name, self.pending[name])
+        if name not in self.decoded:
+            self.loads += 1
+            try:
+                image_path = os.path.join(ASSETS_DIR, name)
+                self.decoded[name] = pygame.image.load(image_path).convert_alpha()
+            except (pygame.error, FileNotFoundError) as e:
+                # Remember failures too so missing files are not retried every spawn
+                self.decoded[name] = (type(e), str(e))
+        image = self.decoded[name]
+        if isinstance(image, tuple):
+            error_type, message = image
+            raise error_type(message)
+        return image
+
+    # Missing files are cached like images, as the (error type, message) that
+    # is raised again on every hit, so spawns that fall back to a placeholder
+    # are still served from the cache
+    def get(self, name, size=None, colorkey=None):
+        key = (name, size, colorkey)
+        image = self.scaled.get(key)
+        if image is not None:
+            self.hits += 1
+            self.scaled.move_to_end(key)
+        else:
+            self.misses += 1
+            try:
+                image = _build_image(self, name, size, colorkey)
+            except FileNotFoundError as e:
+                image = (type(e), str(e))
+            self.scaled[key] = image
+            if len(self.scaled) > self.max_scaled:
+                self.scaled.popitem(last=False)
+                self.evictions += 1
+        if isinstance(image, tuple):
+            error_type, message = image
+            raise error_type(message)
+        return image
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'loads': self.loads,
+            'evictions': self.evictions,
+            'cached': len(self.scaled),
+            'preloaded': self.preloaded,
+        }
+
+asset_cache = AssetCache()
+
+def _build_image(cache, name, size, colorkey):
     try:
-        image_path = os.path.join('assets', name)
-        image = pygame.image.load(image_path)
-        image = image.convert_alpha()
+        image = cache.decode(name)
         
         # Resize the image if size is specified
         if size:
@@ -78,10 +276,123 @@ def load_image(name, size=None, colorkey=None):
         surf.fill(colorkey if colorkey else (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255)))
         return surf
 
+# Load assets
+# Returned surfaces are shared between callers, so they must not be drawn on
+def load_image(name, size=None, colorkey=None):
+    return asset_cache.get(name, size, colorkey)
+
+# Pre-rendered images shared by every sprite of the same kind and size
+shape_cache = {}
+
+def shared_shape(key, build):
+    image = shape_cache.get(key)
+    if image is None:
+        image = shape_cache[key] = build()
+    return image
+
+# Collision masks, built once per image and shared by every sprite drawn with
+# it. Sprite images only change size with the world resolution, not the
+# window, so masks survive resizes.
+mask_cache = {}
+
+def shared_mask(image):
+    mask = mask_cache.get(image)
+    if mask is None:
+        mask = mask_cache[image] = pygame.mask.from_surface(image)
+    return mask
+
+# Pixel test for two sprites whose rects are already known to overlap
+def masks_overlap(a, b):
+    rect_a, rect_b = a.rect, b.rect
+    offset = (rect_b.x - rect_a.x, rect_b.y - rect_a.y)
+    return shared_mask(a.image).overlap(shared_mask(b.image), offset) is not None
+
+# Like pygame.sprite.collide_mask, but rects are tested first and masks are
+# cached, for use as a collided callback
+def collide_mask(a, b):
+    return a.rect.colliderect(b.rect) and masks_overlap(a, b)
+
+# Free list of reusable sprites. Killed sprites come back through release()
+# but are only handed out again after recycle(), at the end of the frame, so
+# collision results can still read them for the rest of the frame.
+class SpritePool:
+    def __init__(self, factory):
+        self.factory = factory
+        self.free = []
+        self.released = []
+        self.live = 0
+        self.high_water = 0
+        self.created = 0
+        self.reused = 0
+
+    # factory() with no arguments must build an unset sprite for preallocation
+    def preallocate(self, count):
+        while len(self.free) < count:
+            self.free.append(self.factory())
+            self.created += 1
+
+    def acquire(self, *args):
+        if self.free:
+            sprite = self.free.pop()
+            sprite.reset(*args)
+            self.reused += 1
+        else:
+            sprite = self.factory(*args)
+            self.created += 1
+        sprite.pool = self
+        self.live += 1
+        if self.live > self.high_water:
+            self.high_water = self.live
+        return sprite
+
+    def release(self, sprite):
+        self.live -= 1
+        self.released.append(sprite)
+
+    def recycle(self):
+        self.free.extend(self.released)
+        self.released.clear()
+
+    def stats(self):
+        return {
+            'live': self.live,
+            'high_water': self.high_water,
+            'free': len(self.free) + len(self.released),
+            'created': self.created,
+            'reused': self.reused,
+        }
+
+# Sprites that go back to the SpritePool they came from when killed
+class PooledSprite(pygame.sprite.Sprite):
+    pool = None
+
+    def kill(self):
+        super().kill()
+        if self.pool is not None:
+            pool, self.pool = self.pool, None
+            pool.release(self)
+
+# Pool sizes to preallocate per difficulty, from the high-water marks of
+# headless runs (python spacefighter.py --headless --difficulty ...) with some
+# headroom for a human on the trigger. Enemies are capped by enemy_budget, so
+# their pool is sized from DIFFICULTY instead.
+POOL_SIZES = {
+    difficulty: {'bullet': 6, 'enemy': settings['enemy_budget'], 'powerup': 2}
+    for difficulty, settings in DIFFICULTY.items()
+}
+
+def player_placeholder(player_width, player_height):
+    image = pygame.Surface((player_width, player_height), pygame.SRCALPHA)
+    pygame.draw.polygon(image, GREEN, [(0, player_height), 
+                                       (player_width//2, 0), 
+                                       (player_width, player_height)])
+    return image
+
 # Player class
 class Player(pygame.sprite.Sprite):
-    def __init__(self):
+    def __init__(self, sim):
         super().__init__()
+        self.sim = sim
         # Calculate responsive sizes based on screen dimensions
         player_width = int(SCREEN_WIDTH * 0.06)  # 6% of screen width
         player_height = int(SCREEN_HEIGHT * 0.08)  # 8% of screen height
@@ -89,11 +400,9 @@ class Player(pygame.sprite.Sprite):
         try:
             self.image = load_image('player_ship.png', (player_width, player_height))
         except:
-            # Create a placeholder triangle for the player ship
-            self.image = pygame.Surface((player_width, player_height), pygame.SRCALPHA)
-            pygame.draw.polygon(self.image, GREEN, [(0, player_height), 
-                                                   (player_width//2, 0), 
-                                                   (player_width, player_height)])
+            # Use a placeholder triangle for the player ship
+            self.image = shared_shape(('player', player_width, player_height),
+                                      lambda: player_placeholder(player_width, player_height))
         
         self.rect = self.image.get_rect()
         self.rect.centerx = SCREEN_WIDTH // 2
@@ -103,7 +412,7 @@ class Player(pygame.sprite.Sprite):
         self.forward_count = 0
         self.max_forward = 2
         self.shoot_delay = 250  # milliseconds
-        self.last_shot = pygame.time.get_ticks()
+        self.last_shot = sim.ticks
         self.lives = 3
         self.score = 0
         
@@ -123,18 +432,39 @@ class Player(pygame.sprite.Sprite):
             self.rect.top = SCREEN_HEIGHT // 2
     
     def shoot(self):
-        now = pygame.time.get_ticks()
+        now = self.sim.ticks
         if now - self.last_shot > self.shoot_delay:
             self.last_shot = now
-            bullet = Bullet(self.rect.centerx, self.rect.top)
-            all_sprites.add(bullet)
-            bullets.add(bullet)
+            bullet = self.sim.bullet_pool.acquire(self.rect.centerx, self.rect.top)
+            self.sim.add(bullet, self.sim.bullets)
             # Play sound effect here if available
 
+# Placeholder drawing for an enemy when its image is missing
+def enemy_placeholder(enemy_type, enemy_width, enemy_height):
+    image = pygame.Surface((enemy_width, enemy_height), pygame.SRCALPHA)
+    if enemy_type == 'regular':
+        pygame.draw.polygon(image, RED, [(0, 0), 
+                                         (enemy_width, 0), 
+                                         (enemy_width//2, enemy_height)])
+    else:  # special enemy
+        pygame.draw.polygon(image, PURPLE, [(0, enemy_height), 
+                                            (enemy_width//2, 0), 
+                                            (enemy_width, enemy_height)])
+    return image
+
 # Enemy class
-class Enemy(pygame.sprite.Sprite):
-    def __init__(self, enemy_type='regular'):
+class Enemy(PooledSprite):
+    # An enemy_type of None leaves the enemy unset, for preallocated pools
+    def __init__(self, sim, enemy_type='regular'):
         super().__init__()
+        self.sim = sim
+        if enemy_type:
+            self.reset(enemy_type)
+    
+    # Set up a new or recycled enemy
+    def reset(self, enemy_type='regular'):
+        sim = self.sim
+        rng = sim.rng
         # Calculate responsive sizes based on screen dimensions
         enemy_width = int(SCREEN_WIDTH * 0.05)  # 5% of screen width
         enemy_height = int(SCREEN_HEIGHT * 0.07)  # 7% of screen height
@@ -148,31 +478,24 @@ class Enemy(pygame.sprite.Sprite):
             else:  # special enemy
                 self.image = load_image('special_enemy_ship.png', (enemy_width, enemy_height))
         except:
-            # Create a placeholder for enemy
-            self.image = pygame.Surface((enemy_width, enemy_height), pygame.SRCALPHA)
-            if enemy_type == 'regular':
-                pygame.draw.polygon(self.image, RED, [(0, 0), 
-                                                     (enemy_width, 0), 
-                                                     (enemy_width//2, enemy_height)])
-            else:  # special enemy
-                pygame.draw.polygon(self.image, PURPLE, [(0, enemy_height), 
-                                                        (enemy_width//2, 0), 
-                                                        (enemy_width, enemy_height)])
+            # Use a placeholder for enemy
+            self.image = shared_shape(('enemy', enemy_type, enemy_width, enemy_height),
+                                      lambda: enemy_placeholder(enemy_type, enemy_width, enemy_height))
         
         self.rect = self.image.get_rect()
-        self.rect.x = random.randrange(SCREEN_WIDTH - self.rect.width)
-        self.rect.y = random.randrange(-100, -40)
+        self.rect.x = rng.randrange(SCREEN_WIDTH - self.rect.width)
+        self.rect.y = rng.randrange(-100, -40)
         
         # Get speed range based on current difficulty
-        min_speed, max_speed = DIFFICULTY[current_difficulty]['enemy_speed_range']
-        self.speedy = random.randrange(min_speed, max_speed + 1)
+        min_speed, max_speed = DIFFICULTY[sim.difficulty]['enemy_speed_range']
+        self.speedy = rng.randrange(min_speed, max_speed + 1)
         
         # Special enemies move faster and can move diagonally
         if enemy_type == 'special':
             self.speedy += 1
-            self.speedx = random.randrange(-3, 4)
+            self.speedx = rng.randrange(-3, 4)
         else:
-            self.speedx = random.randrange(-2, 3)
+            self.speedx = rng.randrange(-2, 3)
         
     def update(self):
         self.rect.y += self.speedy
@@ -180,24 +503,44 @@ class Enemy(pygame.sprite.Sprite):
         
         # If enemy goes off screen, respawn it
         if self.rect.top > SCREEN_HEIGHT + 10 or self.rect.left < -25 or self.rect.right > SCREEN_WIDTH + 25:
-            self.rect.x = random.randrange(SCREEN_WIDTH - self.rect.width)
-            self.rect.y = random.randrange(-100, -40)
+            rng = self.sim.rng
+            self.rect.x = rng.randrange(SCREEN_WIDTH - self.rect.width)
+            self.rect.y = rng.randrange(-100, -40)
             
             # Get speed range based on current difficulty
-            min_speed, max_speed = DIFFICULTY[current_difficulty]['enemy_speed_range']
-            self.speedy = random.randrange(min_speed, max_speed + 1)
+            min_speed, max_speed = DIFFICULTY[self.sim.difficulty]['enemy_speed_range']
+            self.speedy = rng.randrange(min_speed, max_speed + 1)
             
             # Special enemies move faster and can move diagonally
             if self.enemy_type == 'special':
                 self.speedy += 1
-                self.speedx = random.randrange(-3, 4)
+                self.speedx = rng.randrange(-3, 4)
             else:
-                self.speedx = random.randrange(-2, 3)
+                self.speedx = rng.randrange(-2, 3)
+
+def powerup_placeholder(power_type, powerup_size):
+    image = pygame.Surface((powerup_size, powerup_size), pygame.SRCALPHA)
+    if power_type == 'life':
+        # Heart shape for life power-up
+        pygame.draw.circle(image, RED, (powerup_size//4, powerup_size//4), powerup_size//4)
+        pygame.draw.circle(image, RED, (powerup_size*3//4, powerup_size//4), powerup_size//4)
+        pygame.draw.polygon(image, RED, [(0, powerup_size//4), 
+                                         (powerup_size//2, powerup_size), 
+                                         (powerup_size, powerup_size//4)])
+    return image
 
 # PowerUp class
-class PowerUp(pygame.sprite.Sprite):
-    def __init__(self, power_type='life'):
+class PowerUp(PooledSprite):
+    # A power_type of None leaves the power-up unset, for preallocated pools
+    def __init__(self, sim, power_type='life'):
         super().__init__()
+        self.sim = sim
+        if power_type:
+            self.reset(power_type)
+    
+    # Set up a new or recycled power-up
+    def reset(self, power_type='life'):
+        rng = self.sim.rng
         # Calculate responsive sizes based on screen dimensions
         powerup_size = int(SCREEN_WIDTH * 0.04)  # 4% of screen width
         
@@ -207,19 +550,13 @@ class PowerUp(pygame.sprite.Sprite):
             if power_type == 'life':
                 self.image = load_image('life.png', (powerup_size, powerup_size))
         except:
-            # Create a placeholder for power-up
-            self.image = pygame.Surface((powerup_size, powerup_size), pygame.SRCALPHA)
-            if power_type == 'life':
-                # Heart shape for life power-up
-                pygame.draw.circle(self.image, RED, (powerup_size//4, powerup_size//4), powerup_size//4)
-                pygame.draw.circle(self.image, RED, (powerup_size*3//4, powerup_size//4), powerup_size//4)
-                pygame.draw.polygon(self.image, RED, [(0, powerup_size//4), 
-                                                     (powerup_size//2, powerup_size), 
-                                                     (powerup_size, powerup_size//4)])
+            # Use a placeholder for power-up
+            self.image = shared_shape(('powerup', power_type, powerup_size),
+                                      lambda: powerup_placeholder(power_type, powerup_size))
         
         self.rect = self.image.get_rect()
-        self.rect.x = random.randrange(SCREEN_WIDTH - self.rect.width)
-        self.rect.y = random.randrange(-150, -100)
+        self.rect.x = rng.randrange(SCREEN_WIDTH - self.rect.width)
+        self.rect.y = rng.randrange(-150, -100)
         self.speedy = 3
         
     def update(self):
@@ -228,16 +565,27 @@ class PowerUp(pygame.sprite.Sprite):
         if self.rect.top > SCREEN_HEIGHT:
             self.kill()
 
+def bullet_image(bullet_width, bullet_height):
+    image = pygame.Surface((bullet_width, bullet_height))
+    image.fill(BLUE)
+    return image
+
 # Bullet class
-class Bullet(pygame.sprite.Sprite):
-    def __init__(self, x, y):
+class Bullet(PooledSprite):
+    # An x of None leaves the bullet unset, for preallocated pools
+    def __init__(self, x=None, y=None):
         super().__init__()
+        if x is not None:
+            self.reset(x, y)
+    
+    # Set up a new or recycled bullet
+    def reset(self, x, y):
         # Calculate responsive sizes based on screen dimensions
         bullet_width = max(int(SCREEN_WIDTH * 0.006), 3)  # 0.6% of screen width, minimum 3px
         bullet_height = max(int(SCREEN_HEIGHT * 0.015), 8)  # 1.5% of screen height, minimum 8px
         
-        self.image = pygame.Surface((bullet_width, bullet_height))
-        self.image.fill(BLUE)
+        self.image = shared_shape(('bullet', bullet_width, bullet_height),
+                                  lambda: bullet_image(bullet_width, bullet_height))
         self.rect = self.image.get_rect()
         self.rect.centerx = x
         self.rect.bottom = y
@@ -249,63 +597,593 @@ class Bullet(pygame.sprite.Sprite):
         if self.rect.bottom < 0:
             self.kill()
 
-# Explosion animation
-class Explosion(pygame.sprite.Sprite):
-    def __init__(self, center):
-        super().__init__()
-        # Calculate responsive size based on screen dimensions
-        self.size = int(SCREEN_WIDTH * 0.06)  # 6% of screen width
-        self.image = pygame.Surface((self.size, self.size), pygame.SRCALPHA)
-        pygame.draw.circle(self.image, RED, (self.size // 2, self.size // 2), self.size // 2)
-        self.rect = self.image.get_rect()
-        self.rect.center = center
-        self.frame = 0
-        self.frame_rate = 50
-        self.last_update = pygame.time.get_ticks()
-        
+def circle_image(color, size):
+    image = pygame.Surface((size, size), pygame.SRCALPHA)
+    pygame.draw.circle(image, color, (size // 2, size // 2), size // 2)
+    return image
+
+# Animation sheet: every frame of an effect rendered once and played back by
+# index from the simulation clock
+class AnimationSheet:
+    def __init__(self, frames, frame_ms):
+        self.frames = frames
+        self.frame_ms = frame_ms
+        # Top-left of each frame relative to the point it is centered on
+        self.offsets = [(-frame.get_width() // 2, -frame.get_height() // 2) for frame in frames]
+
+    # Frame to show elapsed_ms after the start, or None once it has finished
+    def frame_index(self, elapsed_ms):
+        index = int(elapsed_ms // self.frame_ms)
+        if index < len(self.frames):
+            return index
+        return None
+
+def build_explosion_sheet():
+    # Calculate responsive size based on screen dimensions
+    size = int(SCREEN_WIDTH * 0.06)  # 6% of screen width
+    frames = [circle_image(RED, size)]
+    for frame in range(1, 8):
+        # Shrinking orange circles; the last one stays up once they get too small
+        frame_size = size - frame * 5
+        if frame_size > 0:
+            frames.append(circle_image((255, 100, 0), frame_size))
+        else:
+            frames.append(frames[-1])
+    return AnimationSheet(frames, 50)
+
+# Small fragments thrown out of an explosion, cooling and shrinking
+def build_debris_sheet():
+    frames = []
+    for frame, color in enumerate([(255, 220, 120), (255, 160, 60), (255, 100, 0),
+                                   (200, 60, 0), (140, 30, 0), (90, 20, 0)]):
+        image = pygame.Surface((4 - frame // 2, 4 - frame // 2))
+        image.fill(color)
+        frames.append(image)
+    return AnimationSheet(frames, 60)
+
+ANIMATIONS = {
+    'explosion': build_explosion_sheet,
+    'debris': build_debris_sheet,
+}
+
+# Sheets built on first use
+animation_sheets = {}
+
+def animation_sheet(name):
+    sheet = animation_sheets.get(name)
+    if sheet is None:
+        sheet = animation_sheets[name] = ANIMATIONS[name]()
+    return sheet
+
+# One animation playing at a point, moving at (vx, vy) pixels per frame.
+# Particles are plain slotted records: no __dict__, no group membership.
+class Particle:
+    __slots__ = ('x', 'y', 'vx', 'vy', 'start', 'sheet', 'frame')
+
+# Short-lived visual effects (explosions and their debris) kept outside the
+# sprite groups. Finished particles go on a free list for reuse, and the
+# whole system is drawn with one blits() call. Particles never affect the
+# game, so debris is scattered with its own generator and the simulation's
+# random sequence stays the same.
+class ParticleSystem:
+    DEBRIS = 6  # fragments per explosion
+
+    def __init__(self, sim):
+        self.sim = sim
+        self.rng = random.Random(sim.seed)
+        self.particles = []
+        self.free = []
+        self.high_water = 0
+        self.created = 0
+        self.reused = 0
+
+    def __len__(self):
+        return len(self.particles)
+
+    def emit(self, name, center, velocity=(0, 0)):
+        if self.free:
+            particle = self.free.pop()
+            self.reused += 1
+        else:
+            particle = Particle()
+            self.created += 1
+        particle.x, particle.y = center
+        particle.vx, particle.vy = velocity
+        particle.start = self.sim.ticks
+        particle.sheet = animation_sheet(name)
+        particle.frame = 0
+        self.particles.append(particle)
+        if len(self.particles) > self.high_water:
+            self.high_water = len(self.particles)
+        return particle
+
+    # An explosion flash with debris flying out of it
+    def explode(self, center):
+        self.emit('explosion', center)
+        rng = self.rng
+        for i in range(self.DEBRIS):
+            angle = rng.random() * 2 * math.pi
+            speed = rng.uniform(1.5, 4)
+            self.emit('debris', center, (math.cos(angle) * speed, math.sin(angle) * speed))
+
     def update(self):
-        now = pygame.time.get_ticks()
-        if now - self.last_update > self.frame_rate:
-            self.last_update = now
-            self.frame += 1
-            if self.frame == 8:  # End of animation
-                self.kill()
-            else:
-                size = self.size - self.frame * 5
-                if size > 0:
-                    self.image = pygame.Surface((size, size), pygame.SRCALPHA)
-                    pygame.draw.circle(self.image, (255, 100, 0), (size // 2, size // 2), size // 2)
-                    self.rect = self.image.get_rect()
-                    self.rect.center = self.rect.center
-
-# Background stars
-class Star:
-    def __init__(self):
-        self.x = random.randrange(0, SCREEN_WIDTH)
-        self.y = random.randrange(0, SCREEN_HEIGHT)
-        self.size = random.randrange(1, 3)
-        self.speed = random.randrange(1, 3)
+        now = self.sim.ticks
+        alive = []
+        for particle in self.particles:
+            frame = particle.sheet.frame_index(now - particle.start)
+            if frame is None:  # End of animation
+                self.free.append(particle)
+                continue
+            particle.frame = frame
+            particle.x += particle.vx
+            particle.y += particle.vy
+            alive.append(particle)
+        self.particles = alive
+
+    # (image, topleft) of every particle, alpha of the way from the last update
+    def blits(self, alpha=1.0):
+        back = 1 - alpha
+        blits = []
+        for particle in self.particles:
+            x, y = particle.x, particle.y
+            if back:
+                x -= particle.vx * back
+                y -= particle.vy * back
+            dx, dy = particle.sheet.offsets[particle.frame]
+            blits.append((particle.sheet.frames[particle.frame], (round(x) + dx, round(y) + dy)))
+        return blits
+
+    def draw(self, surface, alpha=1.0):
+        surface.blits(self.blits(alpha), False)
+
+    # Screen areas the particles cover, for dirty-rect rendering
+    def rects(self):
+        return [image.get_rect(topleft=topleft) for image, topleft in self.blits()]
+
+    def stats(self):
+        return {
+            'live': len(self.particles),
+            'high_water': self.high_water,
+            'free': len(self.free),
+            'created': self.created,
+            'reused': self.reused,
+        }
+
+# Background stars: drawn once into one screen-sized surface per parallax
+# layer, so scrolling costs two wrap-around blits per layer however many
+# stars there are
+class Starfield:
+    LAYER_SPEEDS = (1, 2)  # pixels per frame
+    STAR_DENSITY = 100 / (800 * 600)  # 100 stars on the original 800x600 window
+
+    # Layers are drawn once for the world size, with the star count scaled
+    # by its area
+    def __init__(self, size, rng=random):
+        self.rng = rng
+        width, height = size
+        self.height = height
+        count = int(width * height * self.STAR_DENSITY)
+        self.layers = []
+        self.offsets = []
+        self.stars = []  # per layer: (x, y, radius) at offset 0
+        self.moved = [0] * len(self.LAYER_SPEEDS)  # scroll since the last dirty_rects()
+        for index in range(len(self.LAYER_SPEEDS)):
+            layer = pygame.Surface(size)
+            if pygame.display.get_surface():
+                layer = layer.convert()
+            layer.fill(BLACK)
+            stars = []
+            for _ in range(count // len(self.LAYER_SPEEDS)):
+                x = self.rng.randrange(0, width)
+                y = self.rng.randrange(0, height)
+                radius = self.rng.randrange(1, 3)
+                stars.append((x, y, radius))
+                # Stars on the edge are drawn on both sides of the wrap seam
+                for wrapped_y in (y - height, y, y + height):
+                    pygame.draw.circle(layer, WHITE, (x, wrapped_y), radius)
+            # The back layer is opaque and also clears the screen
+            if index:
+                layer.set_colorkey(BLACK, pygame.RLEACCEL)
+            self.layers.append(layer)
+            self.offsets.append(0)
+            self.stars.append(stars)
+
+    def update(self):
+        for index, speed in enumerate(self.LAYER_SPEEDS):
+            self.offsets[index] = (self.offsets[index] + speed) % self.height
+            # Several steps can run between renders, so the scroll adds up;
+            # past a full screen height every row has changed anyway
+            self.moved[index] = min(self.moved[index] + speed, self.height)
+
+    # Screen areas that changed since the last call, for dirty-rect rendering
+    def dirty_rects(self):
+        height = self.height
+        rects = []
+        for stars, offset, moved in zip(self.stars, self.offsets, self.moved):
+            if not moved:
+                continue
+            for x, y, radius in stars:
+                # Cover the star at its old and new position, with a pixel of slack
+                y = (y + offset) % height
+                rect = pygame.Rect(x - radius - 1, y - radius - 1 - moved,
+                                   2 * radius + 3, 2 * radius + 3 + moved)
+                rects.append(rect)
+                # Parts that wrapped around to the other edge
+                if rect.top < 0:
+                    rects.append(rect.move(0, height))
+                elif rect.bottom > height:
+                    rects.append(rect.move(0, -height))
+        self.moved = [0] * len(self.LAYER_SPEEDS)
+        return rects
+
+    # alpha places the layers between the last two updates
+    def draw(self, surface, alpha=1.0):
+        for layer, offset, speed in zip(self.layers, self.offsets, self.LAYER_SPEEDS):
+            if alpha < 1:
+                offset = round(offset - speed * (1 - alpha)) % self.height
+            surface.blit(layer, (0, offset))
+            if offset:
+                surface.blit(layer, (0, offset - self.height))
+
+# Text rendering: resolves the font once and memoizes fonts and rendered strings
+class TextRenderer:
+    def __init__(self, font_name='arial', max_surfaces=128):
+        self.font_name = font_name
+        self.font_path = None
+        self.font_resolved = False
+        self.fonts = {}  # scaled size -> Font
+        self.surfaces = OrderedDict()  # (text, scaled size, color) -> Surface
+        self.max_surfaces = max_surfaces
+
+    def font(self, font_size):
+        font = self.fonts.get(font_size)
+        if font is None:
+            # match_font scans the system font list, so only do it once
+            if not self.font_resolved:
+                self.font_path = pygame.font.match_font(self.font_name)
+                self.font_resolved = True
+            font = pygame.font.Font(self.font_path, font_size)
+            self.fonts[font_size] = font
+        return font
+
+    def render(self, text, size, color=WHITE):
+        # Make font size responsive to screen dimensions
+        font_size = int(size * (SCREEN_WIDTH / 800))  # Scale based on screen width
+        key = (text, font_size, color)
+        text_surface = self.surfaces.get(key)
+        if text_surface is None:
+            text_surface = self.font(font_size).render(text, True, color)
+            self.surfaces[key] = text_surface
+            if len(self.surfaces) > self.max_surfaces:
+                self.surfaces.popitem(last=False)
+        else:
+            self.surfaces.move_to_end(key)
+        return text_surface
+
+text_renderer = TextRenderer()
+
+# Collision grid cells are sized to fit one enemy
+def enemy_cell_size():
+    return max(int(SCREEN_WIDTH * 0.05), int(SCREEN_HEIGHT * 0.07))
+
+# Uniform-grid spatial hash used as a collision broadphase. Sprites are filed
+# under every cell their rect touches and only refiled when that changes.
+# Queries return the same sprites, in the same group order, as pygame's
+# spritecollide/groupcollide. An optional collided callback refines pairs
+# whose rects overlap (see masks_overlap).
+class SpatialHash:
+    def __init__(self, cell_size):
+        self.cell_size = max(1, int(cell_size))
+        self.cells = {}  # (column, row) -> {sprite: None}
+        self.keys = {}  # sprite -> cells it is filed under
+        self.order = {}  # sprite -> insertion number, which matches group order
+        self.next_seq = 0
+
+    def cell_keys(self, rect):
+        size = self.cell_size
+        left, right = rect.left // size, (rect.right - 1) // size
+        top, bottom = rect.top // size, (rect.bottom - 1) // size
+        if left == right and top == bottom:
+            return ((left, top),)
+        return tuple((column, row) for column in range(left, right + 1)
+                     for row in range(top, bottom + 1))
+
+    def file(self, sprite, keys):
+        self.keys[sprite] = keys
+        for key in keys:
+            cell = self.cells.get(key)
+            if cell is None:
+                cell = self.cells[key] = {}
+            cell[sprite] = None
+
+    def unfile(self, sprite):
+        for key in self.keys.pop(sprite):
+            cell = self.cells[key]
+            del cell[sprite]
+            if not cell:
+                del self.cells[key]
+
+    def insert(self, sprite):
+        self.remove(sprite)
+        self.order[sprite] = self.next_seq
+        self.next_seq += 1
+        self.file(sprite, self.cell_keys(sprite.rect))
+
+    def remove(self, sprite):
+        if sprite in self.keys:
+            self.unfile(sprite)
+            del self.order[sprite]
+
+    # Refile sprites that moved into other cells and drop killed ones
+    def update(self):
+        for sprite, keys in list(self.keys.items()):
+            if not sprite.alive():
+                self.remove(sprite)
+                continue
+            new_keys = self.cell_keys(sprite.rect)
+            if new_keys != keys:
+                self.unfile(sprite)
+                self.file(sprite, new_keys)
+
+    # Sprites filed in any cell the rect touches
+    def query(self, rect):
+        found = {}
+        for key in self.cell_keys(rect):
+            cell = self.cells.get(key)
+            if cell:
+                found.update(cell)
+        return found
+
+    def spritecollide(self, sprite, group, dokill, collided=None):
+        rect = sprite.rect
+        hits = [other for other in self.query(rect)
+                if other in group and rect.colliderect(other.rect)
+                and (collided is None or collided(sprite, other))]
+        hits.sort(key=self.order.__getitem__)
+        if dokill:
+            for other in hits:
+                other.kill()
+                self.remove(other)
+        return hits
+
+    # groupa is looked up around each sprite of groupb, so groupb should be
+    # the smaller group (bullets rather than enemies)
+    def groupcollide(self, groupa, groupb, dokilla, dokillb, collided=None):
+        candidates = {}
+        for b in groupb:
+            rect = b.rect
+            for a in self.query(rect):
+                if a in groupa and rect.colliderect(a.rect) and (collided is None or collided(a, b)):
+                    candidates.setdefault(a, []).append(b)
         
+        # Like groupcollide, a killed b only counts for the first a in group order
+        crashed = {}
+        used = set()
+        for a in sorted(candidates, key=self.order.__getitem__):
+            hits = candidates[a]
+            if dokillb:
+                hits = [b for b in hits if b not in used]
+                used.update(hits)
+            if hits:
+                crashed[a] = hits
+        
+        if dokilla:
+            for a in crashed:
+                a.kill()
+                self.remove(a)
+        for b in used:
+            b.kill()
+            self.remove(b)
+        return crashed
+
+# Entity kinds in the struct-of-arrays store
+ENTITY_ENEMY, ENTITY_SPECIAL, ENTITY_BULLET, ENTITY_POWERUP = range(4)
+
+# Struct-of-arrays storage for enemies, bullets and power-ups (numpy backend).
+# Positions, velocities, kinds and liveness live in contiguous arrays, so
+# movement, respawns and kill decisions run as batch operations. Sprites are
+# only thin EntityView objects used for drawing and collision results.
+class EntityStore:
+    FIELDS = (('x', 'int32'), ('y', 'int32'), ('w', 'int32'), ('h', 'int32'),
+              ('vx', 'int32'), ('vy', 'int32'), ('kind', 'int8'), ('alive', 'bool'),
+              ('seq', 'int64'))
+
+    def __init__(self, sim, capacity=256):
+        self.sim = sim
+        # Batch respawns draw from their own generator, seeded from the simulation
+        self.np_rng = np.random.default_rng(sim.rng.getrandbits(64))
+        self.capacity = 0
+        for name, dtype in self.FIELDS:
+            setattr(self, name, np.zeros(0, dtype))
+        self.views = []
+        self.free = []
+        self.next_seq = 0
+        self.grow(capacity)
+
+    def grow(self, capacity):
+        for name, dtype in self.FIELDS:
+            array = np.zeros(capacity, dtype)
+            array[:self.capacity] = getattr(self, name)
+            setattr(self, name, array)
+        self.views.extend([None] * (capacity - self.capacity))
+        # Hand out the lowest free slots first
+        self.free.extend(range(capacity - 1, self.capacity - 1, -1))
+        self.capacity = capacity
+
+    # Copy a freshly built sprite into the arrays and return its view
+    def adopt(self, sprite):
+        if not self.free:
+            self.grow(self.capacity * 2)
+        slot = self.free.pop()
+        if isinstance(sprite, Enemy):
+            kind = ENTITY_SPECIAL if sprite.enemy_type == 'special' else ENTITY_ENEMY
+        elif isinstance(sprite, Bullet):
+            kind = ENTITY_BULLET
+        else:
+            kind = ENTITY_POWERUP
+        rect = sprite.rect
+        self.x[slot] = rect.x
+        self.y[slot] = rect.y
+        self.w[slot] = rect.width
+        self.h[slot] = rect.height
+        self.vx[slot] = getattr(sprite, 'speedx', 0)
+        self.vy[slot] = sprite.speedy
+        self.kind[slot] = kind
+        self.alive[slot] = True
+        self.seq[slot] = self.next_seq
+        self.next_seq += 1
+        view = EntityView(self, slot, sprite)
+        self.views[slot] = view
+        return view
+
+    def release(self, slot):
+        self.alive[slot] = False
+        self.views[slot] = None
+        self.free.append(slot)
+
     def update(self):
-        self.y += self.speed
-        if self.y > SCREEN_HEIGHT:
-            self.y = 0
-            self.x = random.randrange(0, SCREEN_WIDTH)
-            
-    def draw(self, surface):
-        # Ensure star is within screen bounds after resize
-        if 0 <= self.x < SCREEN_WIDTH and 0 <= self.y < SCREEN_HEIGHT:
-            pygame.draw.circle(surface, WHITE, (self.x, self.y), self.size)
+        # Dead slots move too; they are overwritten when the slot is reused
+        self.x += self.vx
+        self.y += self.vy
+        x, y, w, h, kind, alive = self.x, self.y, self.w, self.h, self.kind, self.alive
+        
+        # If enemy goes off screen, respawn it
+        enemy = alive & (kind <= ENTITY_SPECIAL)
+        off_screen = enemy & ((y > SCREEN_HEIGHT + 10) | (x < -25) | (x + w > SCREEN_WIDTH + 25))
+        slots = np.flatnonzero(off_screen)
+        if slots.size:
+            self.respawn(slots)
+        self.sync_rects()
+        
+        # Remove bullets above the screen and power-ups below it
+        gone = alive & (((kind == ENTITY_BULLET) & (y + h < 0)) |
+                        ((kind == ENTITY_POWERUP) & (y > SCREEN_HEIGHT)))
+        for slot in np.flatnonzero(gone):
+            self.views[slot].kill()
+
+    # Copy positions into the views' rects in one pass. Converting whole
+    # arrays with tolist() is far cheaper than reading numpy scalars per view.
+    def sync_rects(self):
+        slots = np.flatnonzero(self.alive)
+        views = self.views
+        for slot, x, y in zip(slots.tolist(), self.x[slots].tolist(), self.y[slots].tolist()):
+            views[slot].rect.topleft = (x, y)
+
+    # Same rule as Enemy.update, for a batch of slots
+    def respawn(self, slots):
+        n = slots.size
+        rng = self.np_rng
+        self.x[slots] = rng.integers(0, SCREEN_WIDTH - self.w[slots])
+        self.y[slots] = rng.integers(-100, -40, n)
+        min_speed, max_speed = DIFFICULTY[self.sim.difficulty]['enemy_speed_range']
+        special = self.kind[slots] == ENTITY_SPECIAL
+        self.vy[slots] = rng.integers(min_speed, max_speed + 1, n) + special
+        self.vx[slots] = np.where(special, rng.integers(-3, 4, n), rng.integers(-2, 3, n))
+
+    # Slots of live entities of the given kinds whose rect overlaps rect,
+    # in creation order like sprite group iteration
+    def overlapping(self, rect, kinds):
+        x, y, kind = self.x, self.y, self.kind
+        # A few comparisons beat np.isin, whose setup dominates at game sizes
+        mask = kind == kinds[0]
+        for other in kinds[1:]:
+            mask |= kind == other
+        mask &= (self.alive & (x < rect.right) & (x + self.w > rect.left) &
+                 (y < rect.bottom) & (y + self.h > rect.top))
+        slots = np.flatnonzero(mask)
+        return slots[np.argsort(self.seq[slots], kind='stable')]
+
+    # Equivalent of spritecollide(sprite, group, True, collided)
+    def collide_sprite(self, sprite, kinds, collided=None):
+        hits = [self.views[slot] for slot in self.overlapping(sprite.rect, kinds)]
+        if collided:
+            hits = [view for view in hits if collided(sprite, view)]
+        for view in hits:
+            view.kill()
+        return hits
+
+    # Equivalent of groupcollide(enemies, bullets, True, True, collided): each
+    # bullet only counts for the first enemy (in group order) it overlaps
+    def collide_bullets(self, collided=None):
+        enemy = np.flatnonzero(self.alive & (self.kind <= ENTITY_SPECIAL))
+        bullet = np.flatnonzero(self.alive & (self.kind == ENTITY_BULLET))
+        if not enemy.size or not bullet.size:
+            return []
+        ex, ey = self.x[enemy, None], self.y[enemy, None]
+        bx, by = self.x[bullet], self.y[bullet]
+        overlap = ((ex < bx + self.w[bullet]) & (ex + self.w[enemy, None] > bx) &
+                   (ey < by + self.h[bullet]) & (ey + self.h[enemy, None] > by))
+        rows = np.flatnonzero(overlap.any(axis=1))
+        rows = rows[np.argsort(self.seq[enemy[rows]], kind='stable')]
+        
+        hits = []
+        used = np.zeros(bullet.size, bool)
+        for row in rows:
+            cols = overlap[row] & ~used
+            if collided and cols.any():
+                view = self.views[enemy[row]]
+                for col in np.flatnonzero(cols):
+                    cols[col] = collided(view, self.views[bullet[col]])
+            if cols.any():
+                used |= cols
+                hits.append(self.views[enemy[row]])
+        for slot in bullet[used]:
+            self.views[slot].kill()
+        for view in hits:
+            view.kill()
+        return hits
+
+# Sprite view of one EntityStore slot. The store refreshes every live view's
+# rect after it moves, so the rect stays where it was when the entity is killed.
+class EntityView(pygame.sprite.Sprite):
+    def __init__(self, store, slot, sprite):
+        super().__init__()
+        self.store = store
+        self.slot = slot
+        self.image = sprite.image
+        self.rect = sprite.rect.copy()
+        for name in ('enemy_type', 'points', 'type'):
+            if hasattr(sprite, name):
+                setattr(self, name, getattr(sprite, name))
+
+    def kill(self):
+        if self.slot is not None:
+            self.store.release(self.slot)
+            self.slot = None
+        super().kill()
 
 # Game functions
 def draw_text(surf, text, size, x, y, color=WHITE):
-    # Make font size responsive to screen dimensions
-    font_size = int(size * (SCREEN_WIDTH / 800))  # Scale based on screen width
-    font = pygame.font.Font(pygame.font.match_font('arial'), font_size)
-    text_surface = font.render(text, True, color)
+    text_surface = text_renderer.render(text, size, color)
     text_rect = text_surface.get_rect()
     text_rect.midtop = (x, y)
     surf.blit(text_surface, text_rect)
+    return text_rect
+
+# HUD label that remembers what it last drew, for dirty-rect rendering
+class HudText:
+    def __init__(self, size, color=WHITE):
+        self.size = size
+        self.color = color
+        self.state = None
+        self.surface = None
+        self.rect = None
+
+    # Set the label without drawing it; returns the screen areas that change
+    def update(self, text, x, y):
+        state = (text, x, y)
+        if state == self.state:
+            return []
+        old_rect = self.rect
+        self.state = state
+        self.surface = text_renderer.render(text, self.size, self.color)
+        self.rect = self.surface.get_rect(midtop=(x, y))
+        if old_rect:
+            return [self.rect.union(old_rect)]
+        return [self.rect]
+
+    def blit(self, surf):
+        surf.blit(self.surface, self.rect)
 
 def draw_lives(surf, x, y, lives, img=None):
     # Calculate responsive size based on screen dimensions
@@ -313,8 +1191,10 @@ def draw_lives(surf, x, y, lives, img=None):
     spacing = int(SCREEN_WIDTH * 0.035)  # 3.5% of screen width for spacing
     
     if img:
-        # Resize the life icon image to be responsive
-        img = pygame.transform.scale(img, (life_icon_size, life_icon_size))
+        # Resize the life icon image to be responsive, once per image
+        source = img
+        img = shared_shape(('life', source, life_icon_size),
+                           lambda: pygame.transform.scale(source, (life_icon_size, life_icon_size)))
         for i in range(lives):
             img_rect = img.get_rect()
             img_rect.x = x + spacing * i
@@ -324,18 +1204,29 @@ def draw_lives(surf, x, y, lives, img=None):
         for i in range(lives):
             pygame.draw.rect(surf, GREEN, (x + spacing * i, y, life_icon_size, life_icon_size))
 
-def show_difficulty_screen():
+# Area covered by draw_lives
+def lives_rect(x, y, lives):
+    life_icon_size = int(SCREEN_WIDTH * 0.025)  # 2.5% of screen width
+    spacing = int(SCREEN_WIDTH * 0.035)  # 3.5% of screen width for spacing
+    return pygame.Rect(x, y, spacing * max(lives - 1, 0) + life_icon_size, life_icon_size)
+
+# startup, if given, gets the time the menu was first on screen
+def show_difficulty_screen(startup=None):
     screen.fill(BLACK)
     draw_text(screen, "SPACE SHOOTER", 64, SCREEN_WIDTH // 2, SCREEN_HEIGHT // 4)
     draw_text(screen, "Select Difficulty:", 36, SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 - 50)
     draw_text(screen, "E - Easy", 24, SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2)
     draw_text(screen, "N - Normal", 24, SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 + 40)
     draw_text(screen, "H - Hard", 24, SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 + 80)
-    pygame.display.flip()
+    viewport.present()
+    if startup is not None:
+        startup.setdefault('menu', time.perf_counter())
     
     waiting = True
     while waiting:
         clock.tick(FPS)
+        # Assets decode in the background while the player chooses
+        asset_cache.finish_preload()
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 pygame.quit()
@@ -350,12 +1241,16 @@ def show_difficulty_screen():
                 if event.key == pygame.K_h:
                     return 'hard'
 
-def show_game_over_screen(score=0):
+def show_game_over_screen(score=0, high_scores=()):
     screen.fill(BLACK)
     draw_text(screen, "SPACE SHOOTER", 64, SCREEN_WIDTH // 2, SCREEN_HEIGHT // 4)
     draw_text(screen, f"Score: {score}", 36, SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2)
+    # Best three scores on this difficulty
+    for i, session in enumerate(high_scores[:3]):
+        draw_text(screen, f"{i + 1}. {session['score']}", 20, SCREEN_WIDTH // 2,
+                  SCREEN_HEIGHT // 2 + 45 + i * 24, YELLOW)
     draw_text(screen, "Press R to restart or Q to quit", 24, SCREEN_WIDTH // 2, SCREEN_HEIGHT * 3/4)
-    pygame.display.flip()
+    viewport.present()
     
     waiting = True
     while waiting:
@@ -373,164 +1268,1277 @@ def show_game_over_screen(score=0):
                     pygame.quit()
                     sys.exit()
 
-# Game loop
-game_over = True
-running = True
-show_difficulty = True
-player_score = 0  # Keep track of score between game sessions
-
-# Handle window resizing
+# Handle window resizing. The world keeps its size, so only the viewport
+# changes; the current frame is shown again at the new scale.
 def handle_resize(event):
-    global SCREEN_WIDTH, SCREEN_HEIGHT, screen
-    SCREEN_WIDTH, SCREEN_HEIGHT = event.size
-    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.RESIZABLE)
-    # Reposition player after resize
-    if 'player' in globals() and player:
-        player.rect.centerx = SCREEN_WIDTH // 2
-        player.rect.bottom = SCREEN_HEIGHT - 10
-
-# Function to spawn a new enemy with a chance of special enemy
-def spawn_enemy():
-    # Check if we should spawn a special enemy based on difficulty
-    if random.random() < DIFFICULTY[current_difficulty]['special_enemy_chance']:
-        enemy = Enemy('special')
-    else:
-        enemy = Enemy('regular')
-    all_sprites.add(enemy)
-    enemies.add(enemy)
-    return enemy
-
-# Create sprite groups
-all_sprites = pygame.sprite.Group()
-enemies = pygame.sprite.Group()
-bullets = pygame.sprite.Group()
-powerups = pygame.sprite.Group()
-
-while running:
-    if show_difficulty:
-        current_difficulty = show_difficulty_screen()
-        show_difficulty = False
-        game_over = True
-    
-    if game_over:
-        show_game_over_screen(player_score)
-        game_over = False
+    global screen
+    viewport.resize(event.size)
+    screen = viewport.surface
+
+# Frame profiler: per-phase timings of the main loop in ring buffers. Phases
+# are timed with lap() calls, each covering the time since the previous one.
+class FrameProfiler:
+    enabled = True
+    PHASES = ('input', 'update', 'spawn', 'collision', 'stars', 'sprites', 'hud', 'flip', 'frame')
+    COUNTS = ('enemies', 'bullets', 'powerups', 'explosions')
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.samples = {name: [0] * size for name in self.PHASES + self.COUNTS}
+        self.frames = 0  # frames recorded in total; the buffers keep the last size
+        self.current = dict.fromkeys(self.PHASES, 0.0)
+        self.frame_start = self.last = 0.0
+
+    def start_frame(self):
+        self.frame_start = self.last = time.perf_counter()
+        for phase in self.PHASES:
+            self.current[phase] = 0.0
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.current[phase] += now - self.last
+        self.last = now
+
+    def end_frame(self, sim):
+        index = self.frames % self.size
+        self.current['frame'] = time.perf_counter() - self.frame_start
+        for phase in self.PHASES:
+            self.samples[phase][index] = self.current[phase] * 1000  # milliseconds
+        self.samples['enemies'][index] = len(sim.enemies)
+        self.samples['bullets'][index] = len(sim.bullets)
+        self.samples['powerups'][index] = len(sim.powerups)
+        self.samples['explosions'][index] = len(sim.explosions)
+        self.frames += 1
+
+    # Samples of one phase or count, oldest first
+    def history(self, name):
+        values = self.samples[name]
+        if self.frames <= self.size:
+            return values[:self.frames]
+        index = self.frames % self.size
+        return values[index:] + values[:index]
+
+    def percentiles(self, name):
+        values = sorted(self.history(name))
+        if not values:
+            return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+        last = len(values) - 1
+        return {f"p{p}": values[min(last, len(values) * p // 100)] for p in (50, 95, 99)}
+
+    def summary(self):
+        return {
+            'frames': self.frames,
+            'phases_ms': {phase: self.percentiles(phase) for phase in self.PHASES},
+            'counts': {name: {'last': self.history(name)[-1] if self.frames else 0,
+                              'max': max(self.history(name), default=0)}
+                       for name in self.COUNTS},
+        }
+
+    # Write the buffered samples as CSV, or the summary and samples as JSON
+    def dump(self, path):
+        names = self.PHASES + self.COUNTS
+        rows = zip(*(self.history(name) for name in names))
+        if path.endswith('.csv'):
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(names)
+                writer.writerows(rows)
+        else:
+            data = self.summary()
+            data['samples'] = [dict(zip(names, row)) for row in rows]
+            with open(path, 'w') as f:
+                json.dump(data, f, indent=1)
+
+# Stand-in used when profiling is off, so the hot path only pays for a no-op call
+class NullProfiler:
+    enabled = False
+
+    def start_frame(self):
+        pass
+
+    def lap(self, phase):
+        pass
+
+    def end_frame(self, sim):
+        pass
+
+NULL_PROFILER = NullProfiler()
+
+# In-game overlay with the profiler's percentiles and entity counts. The text
+# is only rebuilt every refresh frames.
+class ProfilerOverlay:
+    def __init__(self, profiler, size=14, refresh=30):
+        self.profiler = profiler
+        self.size = size
+        self.refresh = refresh
+        self.surface = None
+        self.rect = pygame.Rect(0, 0, 0, 0)
+        self.frames = 0
+
+    def rebuild(self):
+        summary = self.profiler.summary()
+        lines = [f"{'phase':<10}{'p50':>7}{'p95':>7}{'p99':>7}  ms"]
+        for phase, values in summary['phases_ms'].items():
+            lines.append(f"{phase:<10}{values['p50']:>7.2f}{values['p95']:>7.2f}{values['p99']:>7.2f}")
+        lines.append("  ".join(f"{name} {counts['last']}" for name, counts in summary['counts'].items()))
+        
+        # Rendered straight from the font: these strings change too often to cache
+        font = text_renderer.font(int(self.size * (SCREEN_WIDTH / 800)))
+        rendered = [font.render(line, True, WHITE) for line in lines]
+        width = max(line.get_width() for line in rendered) + 8
+        height = sum(line.get_height() for line in rendered) + 8
+        self.surface = pygame.Surface((width, height), pygame.SRCALPHA)
+        self.surface.fill((0, 0, 0, 180))
+        y = 4
+        for line in rendered:
+            self.surface.blit(line, (4, y))
+            y += line.get_height()
+        self.rect = self.surface.get_rect(topleft=(10, int(SCREEN_HEIGHT * 0.08)))
+
+    # Returns the area the overlay now covers
+    def update(self):
+        if self.surface is None or self.frames % self.refresh == 0:
+            self.rebuild()
+        self.frames += 1
+        return self.rect
+
+    def draw(self, surf):
+        surf.blit(self.surface, self.rect)
+
+# Persistent high scores and session telemetry. Sessions are appended as JSON
+# lines to an append-only log by a background thread, in batches, so the game
+# loop only ever enqueues. A small index file next to the log holds the top
+# scores and session counts per difficulty, plus the log size it covers, so
+# startup reads the top-N table and at most the tail of the log written
+# after the index. Once the log passes max_bytes it is compacted down to the
+# top scores and the most recent sessions.
+class ScoreStore:
+    VERSION = 1
+
+    def __init__(self, path, top_n=10, max_bytes=4 << 20, keep_recent=1000):
+        self.path = path
+        self.index_path = path + '.idx'
+        self.top_n = top_n
+        self.max_bytes = max_bytes
+        self.keep_recent = keep_recent
+        self.lock = threading.Lock()  # guards top and sessions
+        self.load()
+        self.queue = queue.Queue()
+        self.writer = threading.Thread(target=self.write_loop, name='scores', daemon=True)
+        self.writer.start()
+
+    def load(self):
+        index = None
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            pass
+        if not index or index.get('version') != self.VERSION:
+            index = {'top': {}, 'sessions': {}, 'log_size': 0}
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if size < index['log_size']:
+            # The log was replaced behind the index's back: rebuild from it
+            index = {'top': {}, 'sessions': {}, 'log_size': 0}
+        self.top = index['top']  # difficulty -> sessions, best first
+        self.sessions = index['sessions']  # difficulty -> sessions ever recorded
+        self.log_size = index['log_size']
+        if size > self.log_size:
+            # Sessions written after the index was last saved. Lines that do
+            # not parse are skipped; a torn last line, from a crash during a
+            # write, is cut off so the next append starts on a fresh line.
+            with open(self.path, 'r+b') as f:
+                f.seek(self.log_size)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    try:
+                        self.add(json.loads(line))
+                    except (ValueError, KeyError, TypeError):
+                        pass
+                    self.log_size += len(line)
+                f.truncate(self.log_size)
+
+    def add(self, session):
+        difficulty, score = session['difficulty'], int(session['score'])
+        self.sessions[difficulty] = self.sessions.get(difficulty, 0) + 1
+        top = self.top.setdefault(difficulty, [])
+        if len(top) < self.top_n or score > top[-1]['score']:
+            # Later sessions rank after earlier ones with the same score
+            position = len(top)
+            while position and top[position - 1]['score'] < score:
+                position -= 1
+            top.insert(position, session)
+            del top[self.top_n:]
+
+    def high_scores(self, difficulty):
+        with self.lock:
+            return list(self.top.get(difficulty, ()))
+
+    # Queue a finished session; never blocks on disk
+    def record(self, session):
+        self.queue.put(session)
+
+    def write_loop(self):
+        while True:
+            batch = [self.queue.get()]
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            sessions = [session for session in batch if session is not None]
+            if sessions:
+                self.append(sessions)
+            if None in batch:
+                return
+
+    def append(self, sessions):
+        data = ''.join(json.dumps(session, separators=(',', ':')) + '\n'
+                       for session in sessions).encode()
+        with open(self.path, 'ab') as f:
+            f.write(data)
+        with self.lock:
+            for session in sessions:
+                self.add(session)
+            self.log_size += len(data)
+        if self.log_size > self.max_bytes:
+            self.compact()
+        self.save_index()
+
+    # Rewrite the log with only the sessions in a top table or among the most
+    # recent; session counts live in the index, so totals survive
+    def compact(self):
+        with open(self.path, 'rb') as f:
+            lines = f.readlines()
+        with self.lock:
+            keep = {json.dumps(session, separators=(',', ':')).encode() + b'\n'
+                    for top in self.top.values() for session in top}
+        recent = len(lines) - self.keep_recent
+        kept = [line for number, line in enumerate(lines) if number >= recent or line in keep]
+        temporary = self.path + '.tmp'
+        with open(temporary, 'wb') as f:
+            f.writelines(kept)
+        os.replace(temporary, self.path)
+        with self.lock:
+            self.log_size = sum(len(line) for line in kept)
+
+    def save_index(self):
+        with self.lock:
+            data = json.dumps({'version': self.VERSION, 'top': self.top,
+                               'sessions': self.sessions, 'log_size': self.log_size})
+        temporary = self.index_path + '.tmp'
+        with open(temporary, 'w') as f:
+            f.write(data)
+        os.replace(temporary, self.index_path)
+
+    # Write out anything queued and stop the writer
+    def close(self):
+        self.queue.put(None)
+        self.writer.join()
+
+# Input recordings: the seed and settings of a game plus every input event,
+# tagged with the simulation frame it was applied on. Replaying them through
+# a Simulation reproduces the game exactly.
+#
+# File layout (little endian): a header, then one record per event, each a
+# uint16 frame delta and a code byte. Action codes are the ACTIONS index with
+# bit 3 set for presses; RESIZE is followed by the new width and height as
+# uint16; SKIP only advances the frame; END is followed by the final frame,
+# score and kills as uint32, for checking replays.
+REPLAY_MAGIC = b'SFRP'
+REPLAY_VERSION = 4
+REPLAY_HEADER = struct.Struct('<4sBQBBBHH')
+REPLAY_EVENT = struct.Struct('<HB')
+REPLAY_SIZE = struct.Struct('<HH')
+REPLAY_END_STATS = struct.Struct('<III')
+REPLAY_PRESSED = 0x08
+REPLAY_RESIZE = 0x80
+REPLAY_SKIP = 0xFE
+REPLAY_END = 0xFF
+ACTIONS = ('left', 'right', 'up', 'down', 'fire')
+BACKENDS = ('sprites', 'numpy')
+HITBOXES = ('mask', 'rect')
+
+class InputRecorder:
+    def __init__(self, sim):
+        # Checked before the game starts rather than when it is saved
+        if not isinstance(sim.seed, int) or not 0 <= sim.seed < 2 ** 64:
+            raise ValueError(f"seed {sim.seed!r} cannot be recorded: "
+                             "recordings need an integer seed from 0 to 2**64 - 1")
+        self.data = bytearray(REPLAY_HEADER.pack(
+            REPLAY_MAGIC, REPLAY_VERSION, sim.seed, list(DIFFICULTY).index(sim.difficulty),
+            BACKENDS.index(sim.backend), HITBOXES.index(sim.hitbox), *viewport.window.get_size()))
+        self.last_frame = 0
+
+    def event(self, frame, code):
+        delta = frame - self.last_frame
+        while delta > 0xFFFF:
+            self.data += REPLAY_EVENT.pack(0xFFFF, REPLAY_SKIP)
+            delta -= 0xFFFF
+        self.data += REPLAY_EVENT.pack(delta, code)
+        self.last_frame = frame
+
+    def action(self, frame, action, pressed):
+        self.event(frame, ACTIONS.index(action) | (REPLAY_PRESSED if pressed else 0))
+
+    def resize(self, frame, size):
+        self.event(frame, REPLAY_RESIZE)
+        self.data += REPLAY_SIZE.pack(*size)
+
+    def save(self, path, sim):
+        # Input can be logged for a step that never ran
+        self.event(max(sim.frame, self.last_frame), REPLAY_END)
+        self.data += REPLAY_END_STATS.pack(sim.frame, sim.score, sim.kills)
+        with open(path, 'wb') as f:
+            f.write(self.data)
+
+# A new file in directory for the recording of this game, named after the
+# time, difficulty and seed. Games that would share a name get a counter;
+# the file is created exclusively so concurrent runs cannot take it too.
+def recording_path(directory, sim):
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.join(directory, f"game-{time.strftime('%Y%m%d-%H%M%S')}-"
+                                   f"{sim.difficulty}-{sim.seed}")
+    number = 0
+    while True:
+        path = f"{stem}-{number}.sfr" if number else f"{stem}.sfr"
+        try:
+            open(path, 'xb').close()
+            return path
+        except FileExistsError:
+            number += 1
+
+class Replay:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, self.seed, difficulty, backend, hitbox, width, height = \
+            REPLAY_HEADER.unpack_from(data)
+        if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+            raise ValueError(f"{path} is not a version {REPLAY_VERSION} recording")
+        self.difficulty = list(DIFFICULTY)[difficulty]
+        self.backend = BACKENDS[backend]
+        self.hitbox = HITBOXES[hitbox]
+        self.size = (width, height)
+        
+        # frame -> [('resize', size) or (action, pressed)], in recorded order
+        self.events = {}
+        self.expected = None
+        offset = REPLAY_HEADER.size
+        frame = 0
+        while offset < len(data):
+            delta, code = REPLAY_EVENT.unpack_from(data, offset)
+            offset += REPLAY_EVENT.size
+            frame += delta
+            if code == REPLAY_END:
+                self.expected = dict(zip(('frames', 'score', 'kills'),
+                                         REPLAY_END_STATS.unpack_from(data, offset)))
+                break
+            elif code == REPLAY_RESIZE:
+                event = ('resize', REPLAY_SIZE.unpack_from(data, offset))
+                offset += REPLAY_SIZE.size
+            elif code == REPLAY_SKIP:
+                continue
+            else:
+                event = (ACTIONS[code & 0x07], bool(code & REPLAY_PRESSED))
+            self.events.setdefault(frame, []).append(event)
+        self.frames = self.expected['frames'] if self.expected else frame
+
+    # Re-run the game as fast as possible, optionally drawing it (realtime
+    # caps it to FPS). Returns the outcome and whether it matches the recording.
+    def run(self, render=False, realtime=False, collision='rect', profiler=NULL_PROFILER):
+        init_display(headless=not render)
+        if render and viewport.window.get_size() != self.size:
+            handle_resize(pygame.event.Event(pygame.VIDEORESIZE, size=self.size))
+        sim = Simulation(self.difficulty, self.seed, backend=self.backend, collision=collision,
+                         hitbox=self.hitbox, profiler=profiler)
+        if render:
+            starfield = Starfield((SCREEN_WIDTH, SCREEN_HEIGHT))
+            renderer = Renderer(self.difficulty)
+        
+        start = time.perf_counter()
+        while sim.frame < self.frames:
+            profiler.start_frame()
+            actions = []
+            for event in self.events.get(sim.frame + 1, ()):
+                if event[0] == 'resize':
+                    # The world does not depend on the window size
+                    if render:
+                        handle_resize(pygame.event.Event(pygame.VIDEORESIZE, size=event[1]))
+                else:
+                    actions.append(event)
+            if render:
+                # Keep the window responsive
+                pygame.event.pump()
+            profiler.lap('input')
+            sim.step(actions)
+            if render:
+                starfield.update()
+                renderer.render(screen, sim, starfield)
+                if realtime:
+                    clock.tick(FPS)
+            profiler.end_frame(sim)
+        elapsed = time.perf_counter() - start
+        
+        result = {'frames': sim.frame, 'score': sim.score, 'kills': sim.kills}
+        return {
+            **result,
+            'matches': self.expected is None or result == self.expected,
+            'elapsed': elapsed,
+            'fps': sim.frame / elapsed if elapsed else 0.0,
+        }
+
+def run_replays(args):
+    profiler = FrameProfiler() if args.profile else NULL_PROFILER
+    mismatches = 0
+    for path in args.replay:
+        replay = Replay(path)
+        result = replay.run(args.render, args.realtime, args.collision, profiler)
+        if not result['matches']:
+            mismatches += 1
+        status = "matches" if result['matches'] else f"DIFFERS from recorded {replay.expected}"
+        print(f"{path}: {result['frames']} frames, score {result['score']}, kills {result['kills']}, "
+              f"{result['fps']:.0f} frames/s, {status}")
+    if profiler.enabled:
+        profiler.dump(args.profile_out)
+        print(f"Frame profile written to {args.profile_out}")
+    if mismatches:
+        sys.exit(1)
+
+# Player actions and the keys that drive them
+KEY_ACTIONS = {
+    pygame.K_LEFT: 'left',
+    pygame.K_RIGHT: 'right',
+    pygame.K_UP: 'up',
+    pygame.K_DOWN: 'down',
+    pygame.K_SPACE: 'fire',
+}
+
+# Game simulation: all gameplay state, advanced by a fixed timestep in step().
+# It never touches the display, the wall clock or the global random module.
+class Simulation:
+    def __init__(self, difficulty='normal', seed=None, frame_ms=1000 / FPS, backend='sprites',
+                 collision='rect', hitbox='mask', profiler=NULL_PROFILER, players=1):
+        self.difficulty = difficulty
+        self.backend = backend
+        self.hitbox = hitbox
+        self.profiler = profiler
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.frame_ms = frame_ms
+        self.frame = 0
+        self.ticks = 0  # simulated milliseconds, used instead of pygame.time.get_ticks()
+        self.score = 0
+        self.kills = 0
+        self.game_over = False
+        
+        # Create sprite groups
+        self.all_sprites = pygame.sprite.Group()
+        self.enemies = pygame.sprite.Group()
+        self.bullets = pygame.sprite.Group()
+        self.powerups = pygame.sprite.Group()
+        self.explosions = ParticleSystem(self)  # explosions and debris
+        
+        # Killed bullets, enemies and power-ups are kept for reuse
+        self.bullet_pool = SpritePool(Bullet)
+        self.enemy_pool = SpritePool(lambda enemy_type=None: Enemy(self, enemy_type))
+        self.powerup_pool = SpritePool(lambda power_type=None: PowerUp(self, power_type))
+        self.pools = {
+            'bullet': self.bullet_pool,
+            'enemy': self.enemy_pool,
+            'powerup': self.powerup_pool,
+        }
+        for name, count in POOL_SIZES[difficulty].items():
+            self.pools[name].preallocate(count)
         
-        # Reset game
-        all_sprites = pygame.sprite.Group()
-        enemies = pygame.sprite.Group()
-        bullets = pygame.sprite.Group()
-        powerups = pygame.sprite.Group()
+        # Optional struct-of-arrays storage for enemies, bullets and power-ups
+        self.store = None
+        if backend == 'numpy':
+            if np is None:
+                raise RuntimeError("The numpy backend requires numpy to be installed")
+            self.store = EntityStore(self)
         
-        player = Player()
-        all_sprites.add(player)
-        player_score = 0  # Reset score for new game
+        # Spatial hash broadphase for the sprite backend ('rect' tests every
+        # pair). Refiling every sprite each frame costs more than pairwise
+        # tests until there are around a thousand entities, so it is opt-in.
+        self.grid = None
+        if self.store is None and collision == 'grid':
+            self.grid = SpatialHash(enemy_cell_size())
+        
+        # Narrow phase for pairs whose rects overlap: image masks, or none
+        self.collided = masks_overlap if hitbox == 'mask' else None
+        
+        # One ship per player, spread evenly along the bottom of the screen.
+        # Co-op players share the score; the game ends when all are out of lives.
+        self.players = []
+        for i in range(players):
+            player = Player(self)
+            player.rect.centerx = SCREEN_WIDTH * (i + 1) // (players + 1)
+            self.players.append(player)
+            self.all_sprites.add(player)
+        self.player = self.players[0]  # the one shown in the HUD
         
         # Spawn initial enemies based on difficulty
-        enemy_count = DIFFICULTY[current_difficulty]['enemy_count']
+        enemy_count = DIFFICULTY[difficulty]['enemy_count']
         for i in range(enemy_count):
-            spawn_enemy()
-        
-        stars = [Star() for _ in range(100)]
+            self.spawn_enemy()
+        self.spawner = SpawnScheduler(self)
+    
+    # Spawn a new enemy with a chance of special enemy, optionally placed
+    # and moving at (speedx, speedy) instead of at random
+    def spawn_enemy(self, position=None, speed=None):
+        # Check if we should spawn a special enemy based on difficulty
+        if self.rng.random() < DIFFICULTY[self.difficulty]['special_enemy_chance']:
+            enemy = self.enemy_pool.acquire('special')
+        else:
+            enemy = self.enemy_pool.acquire('regular')
+        if position:
+            enemy.rect.topleft = position
+        if speed:
+            enemy.speedx, enemy.speedy = speed
+        return self.add(enemy, self.enemies)
     
-    # Keep loop running at the right speed
-    clock.tick(FPS)
+    def spawn_powerup(self, power_type='life'):
+        return self.add(self.powerup_pool.acquire(power_type), self.powerups)
     
-    # Process input (events)
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-        elif event.type == pygame.VIDEORESIZE:
-            handle_resize(event)
-        elif event.type == pygame.KEYDOWN:
-            if event.key == pygame.K_LEFT:
+    # Register a new sprite. The numpy backend swaps moving entities for
+    # array-backed views.
+    def add(self, sprite, group):
+        if self.store is not None and isinstance(sprite, (Enemy, Bullet, PowerUp)):
+            template = sprite
+            sprite = self.store.adopt(template)
+            # The view has copied what it needs, so a pooled template can go back
+            template.kill()
+        self.all_sprites.add(sprite)
+        group.add(sprite)
+        if self.grid is not None:
+            self.grid.insert(sprite)
+        return sprite
+    
+    # Bullet-enemy collisions, with the same results as
+    # groupcollide(enemies, bullets, True, True, collide_mask) for mask hitboxes
+    def collide_bullets(self):
+        if self.store is not None:
+            return self.store.collide_bullets(self.collided)
+        if self.grid is not None:
+            return self.grid.groupcollide(self.enemies, self.bullets, True, True, self.collided)
+        return pygame.sprite.groupcollide(self.enemies, self.bullets, True, True,
+                                          collide_mask if self.collided else None)
+    
+    # Player collisions with enemies or power-ups, with the same results as
+    # spritecollide(player, group, True, collide_mask) for mask hitboxes
+    def collide_player(self, player, group):
+        if self.store is not None:
+            kinds = (ENTITY_POWERUP,) if group is self.powerups else (ENTITY_ENEMY, ENTITY_SPECIAL)
+            return self.store.collide_sprite(player, kinds, self.collided)
+        if self.grid is not None:
+            return self.grid.spritecollide(player, group, True, self.collided)
+        return pygame.sprite.spritecollide(player, group, True,
+                                           collide_mask if self.collided else None)
+    
+    # Apply a single press or release of one of the KEY_ACTIONS by the
+    # player with that index
+    def handle_action(self, action, pressed, index=0):
+        player = self.players[index]
+        if not player.alive():
+            return
+        if pressed:
+            if action == 'left':
                 player.speedx = -5
-            elif event.key == pygame.K_RIGHT:
+            elif action == 'right':
                 player.speedx = 5
-            elif event.key == pygame.K_UP:
+            elif action == 'up':
                 if player.forward_count < player.max_forward:
                     player.speedy = -5
                     player.forward_count += 1
-            elif event.key == pygame.K_DOWN:
+            elif action == 'down':
                 if player.forward_count > 0:
                     player.speedy = 5
-            elif event.key == pygame.K_SPACE:
+            elif action == 'fire':
                 player.shoot()
-        elif event.type == pygame.KEYUP:
-            if event.key == pygame.K_LEFT and player.speedx < 0:
+        else:
+            if action == 'left' and player.speedx < 0:
                 player.speedx = 0
-            elif event.key == pygame.K_RIGHT and player.speedx > 0:
+            elif action == 'right' and player.speedx > 0:
                 player.speedx = 0
-            elif event.key == pygame.K_UP and player.speedy < 0:
+            elif action == 'up' and player.speedy < 0:
                 player.speedy = 0
-            elif event.key == pygame.K_DOWN and player.speedy > 0:
+            elif action == 'down' and player.speedy > 0:
                 player.speedy = 0
                 player.forward_count -= 1
     
-    # Update
-    all_sprites.update()
-    for star in stars:
-        star.update()
-    
-    # Randomly spawn new enemies based on difficulty
-    if random.random() < DIFFICULTY[current_difficulty]['enemy_spawn_rate']:
-        spawn_enemy()
-    
-    # Randomly spawn life power-up based on difficulty
-    if random.random() < DIFFICULTY[current_difficulty]['life_powerup_chance']:
-        powerup = PowerUp('life')
-        all_sprites.add(powerup)
-        powerups.add(powerup)
-    
-    # Check for bullet-enemy collisions
-    hits = pygame.sprite.groupcollide(enemies, bullets, True, True)
-    for hit in hits:
-        player_score += hit.points  # Add points based on enemy type
-        player.score = player_score  # Update player's score
-        explosion = Explosion(hit.rect.center)
-        all_sprites.add(explosion)
-        spawn_enemy()
-    
-    # Check for player-powerup collisions
-    hits = pygame.sprite.spritecollide(player, powerups, True)
-    for hit in hits:
-        if hit.type == 'life':
-            player.lives += 1
-            # Play power-up sound here if available
-    
-    # Check for player-enemy collisions
-    hits = pygame.sprite.spritecollide(player, enemies, True)
-    for hit in hits:
-        player.lives -= 1
-        explosion = Explosion(hit.rect.center)
-        all_sprites.add(explosion)
-        spawn_enemy()
-        
-        if player.lives <= 0:
-            player_score = player.score  # Save score before game over
-            game_over = True
-            show_difficulty = True  # Show difficulty selection on next restart
+    # Advance one frame. actions is a sequence of (action, pressed) pairs for
+    # the first player, or (action, pressed, player index) triples.
+    def step(self, actions=()):
+        self.frame += 1
+        self.ticks = self.frame * self.frame_ms
+        
+        for action in actions:
+            self.handle_action(*action)
+        
+        # Update
+        if self.store is None:
+            self.all_sprites.update()
+            self.explosions.update()
+        else:
+            for player in self.players:
+                if player.alive():
+                    player.update()
+            self.explosions.update()
+            self.store.update()
+        self.profiler.lap('update')
+        
+        # Spawn new enemies, waves and power-ups that are due
+        self.spawner.update()
+        self.profiler.lap('spawn')
+        
+        # Refile moved entities in the collision grid
+        if self.grid is not None:
+            self.grid.update()
+        
+        # Check for bullet-enemy collisions
+        hits = self.collide_bullets()
+        for hit in hits:
+            self.score += hit.points  # Add points based on enemy type
+            self.kills += 1
+            self.explosions.explode(hit.rect.center)
+            self.spawner.replace()
+        
+        players = [player for player in self.players if player.alive()]
+        for player in players:
+            player.score = self.score  # Update player's score
+        
+        # Check for player-powerup collisions
+        for player in players:
+            hits = self.collide_player(player, self.powerups)
+            for hit in hits:
+                if hit.type == 'life':
+                    player.lives += 1
+                    # Play power-up sound here if available
+        
+        # Check for player-enemy collisions
+        for player in players:
+            hits = self.collide_player(player, self.enemies)
+            for hit in hits:
+                player.lives -= 1
+                self.explosions.explode(hit.rect.center)
+                self.spawner.replace()
+            
+            if player.lives <= 0 and len(self.players) > 1:
+                player.kill()  # out of the co-op game; the others play on
+        if all(player.lives <= 0 for player in self.players):
+            self.game_over = True
+        
+        # Sprites killed this frame can be reused from the next one
+        for pool in self.pools.values():
+            pool.recycle()
+        self.profiler.lap('collision')
     
-    # Draw / render
-    screen.fill(BLACK)
+    def pool_stats(self):
+        stats = {name: pool.stats() for name, pool in self.pools.items()}
+        stats['particle'] = self.explosions.stats()
+        return stats
+
+# Enemy formations for waves: offsets of each ship from the formation's
+# top-left, in world pixels
+FORMATIONS = {
+    # Side by side
+    'line': lambda count: [(i * 50, 0) for i in range(count)],
+    # A V with its point leading
+    'vee': lambda count: [(i * 45, -abs(i - count // 2) * 40) for i in range(count)],
+    # One behind the other
+    'column': lambda count: [(0, -i * 60) for i in range(count)],
+}
+WAVES = ('line', 'vee', 'column')  # played in turn
+REPLACE_DELAY = FPS // 2  # frames before a destroyed enemy is replaced
+
+# Spawn scheduler: spawns are events on a priority queue keyed by simulation
+# frame. Random streams draw the gap to their next arrival when one fires
+# (exponential, the same average rate as the old per-frame rolls), waves
+# bring in a formation every wave_interval seconds, destroyed enemies are
+# replaced after REPLACE_DELAY, and no enemy spawns past the difficulty's
+# enemy_budget. Spawned sprites come from the Simulation's pools.
+class SpawnScheduler:
+    def __init__(self, sim):
+        self.sim = sim
+        self.settings = DIFFICULTY[sim.difficulty]
+        self.queue = []  # (frame, sequence, kind, data)
+        self.sequence = 0  # keeps events due on the same frame in order
+        self.spawned = 0
+        self.over_budget = 0  # enemy spawns dropped because of the budget
+        self.schedule_stream('enemy', self.settings['enemy_spawn_rate'])
+        self.schedule_stream('powerup', self.settings['life_powerup_chance'])
+        if self.settings['wave_interval']:
+            self.schedule(sim.frame + self.settings['wave_interval'] * FPS, 'wave', 0)
+
+    def schedule(self, frame, kind, data=None):
+        heapq.heappush(self.queue, (frame, self.sequence, kind, data))
+        self.sequence += 1
+
+    # Queue the next arrival of a random stream with this chance per frame
+    def schedule_stream(self, kind, rate):
+        if rate > 0:
+            gap = math.ceil(self.sim.rng.expovariate(rate))
+            self.schedule(self.sim.frame + max(1, gap), kind, rate)
+
+    # Replace a destroyed enemy after a short delay
+    def replace(self):
+        self.schedule(self.sim.frame + REPLACE_DELAY, 'replace')
+
+    # Run every event due by the current frame
+    def update(self):
+        queue = self.queue
+        frame = self.sim.frame
+        while queue and queue[0][0] <= frame:
+            _, _, kind, data = heapq.heappop(queue)
+            if kind == 'enemy':
+                self.spawn_enemy()
+                self.schedule_stream(kind, data)
+            elif kind == 'replace':
+                self.spawn_enemy()
+            elif kind == 'powerup':
+                self.sim.spawn_powerup()
+                self.schedule_stream(kind, data)
+            elif kind == 'wave':
+                self.spawn_wave(WAVES[data % len(WAVES)])
+                self.schedule(frame + self.settings['wave_interval'] * FPS, 'wave', data + 1)
+
+    def spawn_enemy(self, position=None, speed=None):
+        if len(self.sim.enemies) >= self.settings['enemy_budget']:
+            self.over_budget += 1
+            return None
+        self.spawned += 1
+        return self.sim.spawn_enemy(position, speed)
+
+    # Bring in a formation above the screen, flying straight down together
+    def spawn_wave(self, formation):
+        rng = self.sim.rng
+        offsets = FORMATIONS[formation](self.settings['wave_size'])
+        width = max(dx for dx, dy in offsets) + int(SCREEN_WIDTH * 0.05)
+        left = rng.randrange(max(1, SCREEN_WIDTH - width))
+        min_speed, max_speed = self.settings['enemy_speed_range']
+        speed = (0, rng.randrange(min_speed, max_speed + 1))
+        for dx, dy in offsets:
+            self.spawn_enemy((left + dx, -100 + dy), speed)
+
+    def stats(self):
+        return {'spawned': self.spawned, 'over_budget': self.over_budget, 'queued': len(self.queue)}
+
+# Scripted player for headless runs: strafes under the lowest enemy and keeps
+# tapping fire (shots only trigger on a key press, so fire is released every
+# other frame)
+class ChaserPolicy:
+    def __init__(self):
+        self.held = set()
     
-    # Draw stars
-    for star in stars:
-        star.draw(screen)
+    def __call__(self, sim):
+        want = set() if 'fire' in self.held else {'fire'}
+        player = sim.player
+        enemies = sim.enemies.sprites()
+        if enemies:
+            target = max(enemies, key=lambda enemy: enemy.rect.bottom)
+            dx = target.rect.centerx - player.rect.centerx
+            if dx < -5:
+                want.add('left')
+            elif dx > 5:
+                want.add('right')
+        actions = [(action, False) for action in sorted(self.held - want)]
+        actions += [(action, True) for action in sorted(want - self.held)]
+        self.held = want
+        return actions
+
+# Player that never touches the controls
+def idle_policy(sim):
+    return ()
+
+POLICIES = {
+    'chaser': ChaserPolicy,
+    'idle': lambda: idle_policy,
+}
+
+# Run one game without a window or frame cap and report simulation throughput
+def run_headless(difficulty='normal', seed=None, policy=None, max_frames=FPS * 60 * 10,
+                 backend='sprites', collision='rect', profiler=NULL_PROFILER, record=None,
+                 hitbox='mask'):
+    init_display(headless=True)
+    sim = Simulation(difficulty, seed, backend=backend, collision=collision, hitbox=hitbox,
+                     profiler=profiler)
+    policy = policy or ChaserPolicy()
+    recorder = InputRecorder(sim) if record else None
     
-    # Draw all sprites
-    all_sprites.draw(screen)
+    start = time.perf_counter()
+    while not sim.game_over and sim.frame < max_frames:
+        profiler.start_frame()
+        actions = policy(sim)
+        if recorder:
+            for action, pressed in actions:
+                recorder.action(sim.frame + 1, action, pressed)
+        profiler.lap('input')
+        sim.step(actions)
+        profiler.end_frame(sim)
+    elapsed = time.perf_counter() - start
+    if recorder:
+        recorder.save(recording_path(record, sim), sim)
     
-    # Draw UI
-    draw_text(screen, str(player.score), 18, SCREEN_WIDTH // 2, 10)
-    draw_lives(screen, SCREEN_WIDTH - 100, 10, player.lives)
+    return {
+        'difficulty': difficulty,
+        'seed': seed,
+        'frames': sim.frame,
+        'sim_seconds': sim.ticks / 1000,
+        'score': sim.score,
+        'kills': sim.kills,
+        'game_over': sim.game_over,
+        'elapsed': elapsed,
+        'fps': sim.frame / elapsed if elapsed else 0.0,
+        'pools': sim.pool_stats(),
+        'spawns': sim.spawner.stats(),
+    }
+
+def run_batch(args):
+    total_frames = 0
+    total_elapsed = 0.0
+    high_water = {}
+    over_budget = 0
+    profiler = FrameProfiler() if args.profile else NULL_PROFILER
+    for i in range(args.games):
+        seed = args.seed + i
+        result = run_headless(args.difficulty, seed, POLICIES[args.policy](), args.frames,
+                              args.backend, args.collision, profiler, args.record, args.hitbox)
+        total_frames += result['frames']
+        total_elapsed += result['elapsed']
+        for name, stats in result['pools'].items():
+            high_water[name] = max(high_water.get(name, 0), stats['high_water'])
+        over_budget += result['spawns']['over_budget']
+        print(f"seed {seed}: score {result['score']}, kills {result['kills']}, "
+              f"{result['sim_seconds']:.1f}s survived, {result['fps']:.0f} frames/s")
+    if total_elapsed:
+        print(f"{args.games} games, {total_frames} frames, "
+              f"{total_frames / total_elapsed:.0f} simulated frames/s "
+              f"({total_frames / total_elapsed / FPS:.1f}x real time)")
+    print("Pool high-water marks: " +
+          ", ".join(f"{name} {count}" for name, count in high_water.items()))
+    print(f"Enemy spawns dropped over budget: {over_budget}")
+    if profiler.enabled:
+        profiler.dump(args.profile_out)
+        print(f"Frame profile written to {args.profile_out}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Space Shooter")
+    parser.add_argument('--headless', action='store_true',
+                        help="run simulated games without a window and report throughput")
+    parser.add_argument('--games', type=int, default=10, help="number of headless games")
+    parser.add_argument('--frames', type=int, default=FPS * 60 * 10,
+                        help="frame limit per headless game")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the first headless game")
+    parser.add_argument('--difficulty', choices=DIFFICULTY, default='normal')
+    parser.add_argument('--policy', choices=POLICIES, default='chaser',
+                        help="scripted player for headless games")
+    parser.add_argument('--backend', choices=('sprites', 'numpy'), default='sprites',
+                        help="entity storage: sprite objects or numpy arrays")
+    parser.add_argument('--collision', choices=('grid', 'rect'), default='rect',
+                        help="sprite backend collisions: pairwise rect tests, or a spatial hash "
+                             "(only faster with around a thousand entities or more)")
+    parser.add_argument('--hitbox', choices=HITBOXES, default='mask',
+                        help="what counts as a hit once rects overlap: image pixels or the rect")
+    parser.add_argument('--renderer', choices=('full', 'dirty'), default='full',
+                        help="full redraw and flip, or dirty rectangles only")
+    parser.add_argument('--dirty-threshold', type=float, default=0.5,
+                        help="fraction of the window above which the dirty renderer "
+                             "falls back to a full flip")
+    parser.add_argument('--max-fps', type=int, default=0,
+                        help="cap on rendered frames per second; 0 draws as often as possible "
+                             "(the simulation always runs at %d steps per second)" % FPS)
+    parser.add_argument('--profile', action='store_true',
+                        help="time each phase of the main loop (F3 shows the overlay in game)")
+    parser.add_argument('--profile-out', default='profile.json',
+                        help="where to write the profile on exit; .csv or .json")
+    parser.add_argument('--scores', metavar='FILE', default='scores.log',
+                        help="session log for high scores and telemetry; empty to disable")
+    parser.add_argument('--record', metavar='DIR',
+                        help="save a replayable input recording of every game in DIR")
+    parser.add_argument('--replay', metavar='FILE', nargs='+',
+                        help="re-run recorded games and check they end the same way")
+    parser.add_argument('--render', action='store_true', help="draw replays in a window")
+    parser.add_argument('--realtime', action='store_true',
+                        help="play rendered replays at normal speed instead of flat out")
+    args = parser.parse_args()
+    if args.record and args.seed < 0:
+        parser.error("--record needs a --seed of 0 or more")
+    return args
+
+# Game loop
+difficulty_colors = {'easy': GREEN, 'normal': YELLOW, 'hard': RED}
+
+# Full-screen renderer: redraws everything and flips the whole display
+class Renderer:
+    # Sprites that move further than this in one step have been respawned or
+    # recycled, and are drawn where they are rather than interpolated
+    MAX_INTERPOLATE = 40
+
+    def __init__(self, difficulty):
+        self.difficulty = difficulty
+        self.score_text = HudText(18)
+        self.difficulty_text = HudText(18, difficulty_colors[difficulty])
+        self.overlay = None  # ProfilerOverlay while it is shown
+        self.previous = {}  # sprite -> topleft before the last simulation step
+
+    # Bring the HUD labels up to date; returns the screen areas that change
+    def update_hud(self, sim):
+        dirty = self.score_text.update(str(sim.player.score), SCREEN_WIDTH // 2, 10)
+        # Display current difficulty
+        dirty += self.difficulty_text.update(f"Difficulty: {self.difficulty.capitalize()}", 100, 10)
+        return dirty
+
+    # Note where sprites are before a simulation step, to interpolate from
+    def remember(self, sim):
+        self.previous = {sprite: sprite.rect.topleft for sprite in sim.all_sprites}
+
+    # alpha is how far between the last two simulation steps to draw the
+    # world; 1 draws it as it is
+    def render(self, surface, sim, starfield, alpha=1.0):
+        profiler = sim.profiler
+        # Draw stars; the opaque back layer replaces clearing the screen
+        starfield.draw(surface, alpha)
+        profiler.lap('stars')
+        
+        # Draw all sprites, then the particles over them
+        if alpha < 1:
+            self.draw_interpolated(surface, sim, alpha)
+        else:
+            sim.all_sprites.draw(surface)
+        sim.explosions.draw(surface, alpha)
+        profiler.lap('sprites')
+        
+        # Draw UI
+        self.update_hud(sim)
+        self.score_text.blit(surface)
+        draw_lives(surface, SCREEN_WIDTH - 100, 10, sim.player.lives)
+        self.difficulty_text.blit(surface)
+        if self.overlay:
+            self.overlay.update()
+            self.overlay.draw(surface)
+        profiler.lap('hud')
+        
+        # Show the frame
+        viewport.present()
+        profiler.lap('flip')
+
+    def draw_interpolated(self, surface, sim, alpha):
+        previous = self.previous
+        limit = self.MAX_INTERPOLATE
+        blits = []
+        for sprite in sim.all_sprites:
+            x, y = sprite.rect.topleft
+            old = previous.get(sprite)
+            if old and abs(x - old[0]) <= limit and abs(y - old[1]) <= limit:
+                x = round(old[0] + (x - old[0]) * alpha)
+                y = round(old[1] + (y - old[1]) * alpha)
+            blits.append((sprite.image, (x, y)))
+        surface.blits(blits, False)
+
+# Dirty-rectangle renderer: only the areas where sprites, stars or the HUD
+# changed are restored, redrawn and pushed with display.update(rects). When
+# the dirty area passes full_threshold (a fraction of the window) it falls
+# back to a full redraw and flip.
+class DirtyRenderer(Renderer):
+    def __init__(self, difficulty, full_threshold=0.5):
+        self.full_threshold = full_threshold
+        self.full_frames = 0
+        self.dirty_frames = 0
+        super().__init__(difficulty)
+        # Offscreen copy of the starfield, used to restore dirty areas
+        self.background = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+        if pygame.display.get_surface():
+            self.background = self.background.convert()
+        self.sprite_rects = []
+        self.particle_rects = []
+        self.lives = None
+        self.overlay_rect = None
+        self.full_redraw = True
+
+    # Dirty areas follow the sprite rects, so this renderer draws the last
+    # step as it is and does not interpolate
+    def remember(self, sim):
+        pass
+
+    def render(self, surface, sim, starfield, alpha=1.0):
+        profiler = sim.profiler
+        # The background only changes when the stars scrolled
+        if self.full_redraw or any(starfield.moved):
+            starfield.draw(self.background)
+        dirty = starfield.dirty_rects()
+        profiler.lap('stars')
+        
+        # Sprites are dirty where they were last frame and where they are now
+        sprites = sim.all_sprites.sprites()
+        sprite_rects = [sprite.rect.copy() for sprite in sprites]
+        dirty += self.sprite_rects + sprite_rects
+        self.sprite_rects = sprite_rects
+        particle_rects = sim.explosions.rects()
+        dirty += self.particle_rects + particle_rects
+        self.particle_rects = particle_rects
+        profiler.lap('sprites')
+        
+        dirty += self.update_hud(sim)
+        lives_x = SCREEN_WIDTH - 100
+        if sim.player.lives != self.lives:
+            dirty.append(lives_rect(lives_x, 10, max(sim.player.lives, self.lives or 0)))
+            self.lives = sim.player.lives
+        # The overlay is redrawn every frame, and erased once it is hidden
+        if self.overlay_rect:
+            dirty.append(self.overlay_rect)
+        self.overlay_rect = self.overlay.update() if self.overlay else None
+        if self.overlay_rect:
+            dirty.append(self.overlay_rect)
+        profiler.lap('hud')
+        
+        screen_area = SCREEN_WIDTH * SCREEN_HEIGHT
+        dirty_area = sum(rect.width * rect.height for rect in dirty)
+        if self.full_redraw or dirty_area > screen_area * self.full_threshold:
+            self.full_redraw = False
+            self.full_frames += 1
+            surface.blit(self.background, (0, 0))
+            sim.all_sprites.draw(surface)
+            sim.explosions.draw(surface)
+            self.score_text.blit(surface)
+            draw_lives(surface, lives_x, 10, sim.player.lives)
+            self.difficulty_text.blit(surface)
+            if self.overlay:
+                self.overlay.draw(surface)
+            profiler.lap('sprites')
+            viewport.present()
+            profiler.lap('flip')
+            return
+        
+        # HUD items under a dirty area are redrawn whole, so their full
+        # rect has to be restored too
+        hud = [(self.score_text.rect, self.score_text.blit),
+               (self.difficulty_text.rect, self.difficulty_text.blit),
+               (lives_rect(lives_x, 10, sim.player.lives),
+                lambda surf: draw_lives(surf, lives_x, 10, sim.player.lives))]
+        redraw = [(rect, draw) for rect, draw in hud if rect.collidelist(dirty) != -1]
+        dirty += [rect for rect, draw in redraw]
+        
+        self.dirty_frames += 1
+        for rect in dirty:
+            surface.blit(self.background, rect, rect)
+        for sprite in sprites:
+            surface.blit(sprite.image, sprite.rect)
+        sim.explosions.draw(surface)
+        for rect, draw in redraw:
+            draw(surface)
+        if self.overlay:
+            self.overlay.draw(surface)
+        profiler.lap('sprites')
+        viewport.present(dirty)
+        profiler.lap('flip')
+
+# Fixed-step timing for the main loop. Real time is banked in an accumulator
+# and spent in whole simulation steps, so the game runs at the same speed
+# whatever the render rate, and frames are drawn alpha of the way between
+# the last two steps.
+class FrameClock:
+    MAX_STEPS = 5  # simulation steps per pass of the loop
+    MAX_SKIP = 3  # renders that can be skipped in a row to catch up
+    MAX_BEHIND = 250  # milliseconds of backlog kept; anything older is dropped
+
+    def __init__(self, step_ms):
+        self.step_ms = step_ms
+        self.accumulator = 0.0
+        self.last = time.perf_counter()
+        self.since_render = 0
+        self.dropped = 0  # simulation steps given up under overload
+        self.skipped = 0  # renders skipped to catch up
+        self.loops = 0
+        self.loop_ms_total = 0.0
+        self.loop_ms_max = 0.0
+
+    # Bank the real time since the last call; returns how many steps to run
+    def advance(self):
+        now = time.perf_counter()
+        elapsed = (now - self.last) * 1000
+        self.accumulator += elapsed
+        self.last = now
+        self.loops += 1
+        self.loop_ms_total += elapsed
+        self.loop_ms_max = max(self.loop_ms_max, elapsed)
+        if self.accumulator > self.MAX_BEHIND:
+            # Spiral of death: catching up would take longer than the time
+            # it makes up. Drop the backlog so the game slows down instead.
+            dropped = int((self.accumulator - self.MAX_BEHIND) // self.step_ms) + 1
+            self.dropped += dropped
+            self.accumulator -= dropped * self.step_ms
+        steps = min(int(self.accumulator // self.step_ms), self.MAX_STEPS)
+        self.accumulator -= steps * self.step_ms
+        return steps
+
+    @property
+    def alpha(self):
+        return min(self.accumulator / self.step_ms, 1.0)
+
+    # Whether to draw this pass. While steps are still owed, renders are
+    # skipped (a few in a row at most) so the simulation can catch up.
+    def should_render(self):
+        if self.accumulator >= self.step_ms and self.since_render < self.MAX_SKIP:
+            self.since_render += 1
+            self.skipped += 1
+            return False
+        self.since_render = 0
+        return True
+
+# Cold-start report, in milliseconds since the module started loading. The
+# menu is the first interactive frame; menu time the player spends choosing
+# is included in the first game frame.
+def print_startup(startup):
+    times = {name: (at - STARTED) * 1000 for name, at in startup.items()}
+    parts = [f"display {times['display']:.0f} ms"]
+    if 'menu' in times:
+        parts.append(f"first interactive frame (menu) {times['menu']:.0f} ms")
+    if asset_cache.preload_finished:
+        parts.append(f"{asset_cache.preloaded} assets decoded in "
+                     f"{(asset_cache.preload_finished - asset_cache.preload_started) * 1000:.0f} ms")
+    if 'game' in times:
+        parts.append(f"first game frame {times['game']:.0f} ms")
+    print("Startup: " + ", ".join(parts))
+
+# Telemetry for one finished game, as stored by ScoreStore
+def session_summary(sim, frame_clock):
+    frame_ms = {
+        'mean': round(frame_clock.loop_ms_total / max(1, frame_clock.loops), 3),
+        'max': round(frame_clock.loop_ms_max, 3),
+    }
+    if sim.profiler.enabled:
+        frame_ms.update((name, round(value, 3))
+                        for name, value in sim.profiler.percentiles('frame').items())
+    return {
+        'time': int(time.time()),
+        'difficulty': sim.difficulty,
+        'score': sim.score,
+        'kills': sim.kills,
+        'duration': round(sim.ticks / 1000, 2),
+        'seed': sim.seed,
+        'frame_ms': frame_ms,
+    }
+
+
+def main(args):
+    global current_difficulty
+    init_display()
+    asset_cache.preload()
+    startup = {'display': time.perf_counter()}
     
-    # Display current difficulty
-    difficulty_colors = {'easy': GREEN, 'normal': YELLOW, 'hard': RED}
-    draw_text(screen, f"Difficulty: {current_difficulty.capitalize()}", 
-              18, 100, 10, difficulty_colors[current_difficulty])
+    game_over = True
+    running = True
+    show_difficulty = True
+    player_score = 0  # Keep track of score between game sessions
+    sim = None
+    profiler = FrameProfiler() if args.profile else NULL_PROFILER
+    overlay = None
+    recorder = None
+    frame_clock = None
+    scores = ScoreStore(args.scores) if args.scores else None
     
-    # Flip the display
-    pygame.display.flip()
+    # Quitting from the menus exits through sys.exit(), so report in finally
+    try:
+        while running:
+            if show_difficulty:
+                current_difficulty = show_difficulty_screen(startup)
+                show_difficulty = False
+                game_over = True
+            
+            if game_over:
+                show_game_over_screen(player_score,
+                                      scores.high_scores(current_difficulty) if scores else ())
+                game_over = False
+                
+                # Reset game
+                asset_cache.finish_preload(wait=True)
+                if recorder:
+                    recorder.save(recording_path(args.record, sim), sim)
+                # A fresh seed per game, kept so the game can be recorded and replayed
+                sim = Simulation(current_difficulty, random.randrange(2 ** 32), backend=args.backend,
+                                 collision=args.collision, hitbox=args.hitbox, profiler=profiler)
+                recorder = InputRecorder(sim) if args.record else None
+                player_score = 0  # Reset score for new game
+                
+                starfield = Starfield((SCREEN_WIDTH, SCREEN_HEIGHT))
+                if args.renderer == 'dirty':
+                    renderer = DirtyRenderer(current_difficulty, args.dirty_threshold)
+                else:
+                    renderer = Renderer(current_difficulty)
+                renderer.overlay = overlay
+                # Started after the menus, so time spent in them is not simulated
+                frame_clock = FrameClock(sim.frame_ms)
+                actions = []  # input waiting for the next simulation step
+            
+            # Cap the render rate if asked, then bank the time since the last frame
+            clock.tick(args.max_fps)
+            profiler.start_frame()
+            steps = frame_clock.advance()
+            
+            # Process input (events)
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    running = False
+                elif event.type == pygame.VIDEORESIZE:
+                    handle_resize(event)
+                    if recorder:
+                        recorder.resize(sim.frame + 1, event.size)
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                    # Toggle the profiler overlay, starting the profiler if needed
+                    if not profiler.enabled:
+                        profiler = sim.profiler = FrameProfiler()
+                        profiler.start_frame()
+                    overlay = None if overlay else ProfilerOverlay(profiler)
+                    renderer.overlay = overlay
+                elif event.type in (pygame.KEYDOWN, pygame.KEYUP) and event.key in KEY_ACTIONS:
+                    actions.append((KEY_ACTIONS[event.key], event.type == pygame.KEYDOWN))
+                    if recorder:
+                        recorder.action(sim.frame + 1, *actions[-1])
+            profiler.lap('input')
+            
+            # Update in fixed steps; none may be due yet on a fast render loop
+            for i in range(steps):
+                renderer.remember(sim)
+                sim.step(actions)
+                actions = []
+                starfield.update()
+                profiler.lap('stars')
+                if sim.game_over:
+                    break
+            
+            if sim.game_over:
+                player_score = sim.score  # Save score before game over
+                if scores:
+                    scores.record(session_summary(sim, frame_clock))
+                game_over = True
+                show_difficulty = True  # Show difficulty selection on next restart
+            
+            # Draw / render
+            if frame_clock.should_render():
+                renderer.render(screen, sim, starfield, frame_clock.alpha)
+                startup.setdefault('game', time.perf_counter())
+            profiler.end_frame(sim)
+        
+    finally:
+        if recorder:
+            recorder.save(recording_path(args.record, sim), sim)
+        pygame.quit()
+        if scores:
+            scores.close()
+        if frame_clock and (frame_clock.dropped or frame_clock.skipped):
+            print(f"Overloaded: {frame_clock.dropped} simulation steps dropped, "
+                  f"{frame_clock.skipped} renders skipped")
+        if profiler.enabled:
+            profiler.dump(args.profile_out)
+            print(f"Frame profile written to {args.profile_out}")
+        stats = asset_cache.stats()
+        print(f"Asset cache: {stats['hits']} hits, {stats['misses']} misses, {stats['loads']} file loads")
+        print_startup(startup)
 
-pygame.quit()
\ No newline at end of file
+if __name__ == '__main__':
+    args = parse_args()
+    if args.replay:
+        run_replays(args)
+    elif args.headless:
+        run_batch(args)
+    else:
+        main(args)
@@ -0,0 +1,142 @@
+import argparse
+import copy
+import csv
+import importlib
+import itertools
+import json
+import multiprocessing
+import os
+import statistics
+import time
+
+import spacefighter as sf
+
+# The shipped table, so each game starts from it whatever ran before in the
+# same worker
+BASE_DIFFICULTY = copy.deepcopy(sf.DIFFICULTY)
+
+# A policy is one of spacefighter's POLICIES, or module:factory for anything
+# importable that returns a callable taking the Simulation
+def make_policy(name):
+    if name in sf.POLICIES:
+        return sf.POLICIES[name]()
+    module, _, factory = name.partition(':')
+    return getattr(importlib.import_module(module), factory)()
+
+# Parse "name=value,value,..." with each value an int, a float or an
+# int range written low:high
+def parse_param(text):
+    name, _, values = text.partition('=')
+    if name not in BASE_DIFFICULTY['normal']:
+        raise argparse.ArgumentTypeError(f"unknown difficulty setting {name!r}")
+    parsed = []
+    for value in values.split(','):
+        if ':' in value:
+            parsed.append(tuple(int(part) for part in value.split(':')))
+        elif '.' in value or 'e' in value:
+            parsed.append(float(value))
+        else:
+            parsed.append(int(value))
+    return name, parsed
+
+# Every combination of the swept values
+def parameter_sets(params):
+    names = [name for name, values in params]
+    for values in itertools.product(*(values for name, values in params)):
+        yield dict(zip(names, values))
+
+# Worker: play one seeded game with the difficulty table patched. Workers run
+# one game at a time, so patching the module-level table is safe.
+def play(task):
+    index, difficulty, overrides, seed, policy, max_frames, backend = task
+    sf.DIFFICULTY[difficulty] = {**BASE_DIFFICULTY[difficulty], **overrides}
+    # CPU time rather than wall time: games sharing a core each take longer
+    # on the wall clock without doing any more work
+    cpu = time.process_time()
+    result = sf.run_headless(difficulty, seed, make_policy(policy), max_frames, backend)
+    result['cpu'] = time.process_time() - cpu
+    return index, {name: result[name] for name in
+                   ('seed', 'frames', 'sim_seconds', 'score', 'kills', 'game_over', 'cpu')}
+
+def summarize(games):
+    summary = {'games': len(games)}
+    for name in ('sim_seconds', 'score', 'kills'):
+        values = [game[name] for game in games]
+        summary[name] = statistics.mean(values)
+        summary[name + '_median'] = statistics.median(values)
+        summary[name + '_stdev'] = statistics.stdev(values) if len(values) > 1 else 0.0
+    summary['deaths'] = sum(game['game_over'] for game in games) / len(games)
+    return summary
+
+def write_results(path, rows):
+    if path.endswith('.csv'):
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(path, 'w') as f:
+            json.dump(rows, f, indent=1)
+
+def run_sweep(args):
+    sets = list(parameter_sets(args.param)) or [{}]
+    # The same seeds for every parameter set, so sets are compared on the same games
+    tasks = [(index, args.difficulty, overrides, args.seed + game, args.policy, args.frames,
+              args.backend)
+             for index, overrides in enumerate(sets) for game in range(args.games)]
+    print(f"{len(sets)} parameter sets x {args.games} games on {args.workers} workers")
+
+    games = [[] for _ in sets]
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.workers) as pool:
+        chunksize = max(1, len(tasks) // (args.workers * 8))
+        for index, result in pool.imap_unordered(play, tasks, chunksize):
+            games[index].append(result)
+        # Let the workers exit on their own: SDL's signal handlers in them
+        # swallow the SIGTERM that terminate() would send
+        pool.close()
+        pool.join()
+    wall = time.perf_counter() - start
+
+    rows = []
+    names = [name for name, values in args.param]
+    print(" ".join(f"{name:>20}" for name in names) +
+          f" {'survived s':>10} {'score':>8} {'kills':>7} {'deaths':>7}")
+    for overrides, results in zip(sets, games):
+        summary = summarize(results)
+        rows.append({**{name: str(value) for name, value in overrides.items()}, **summary})
+        print(" ".join(f"{str(overrides[name]):>20}" for name in names) +
+              f" {summary['sim_seconds']:>10.1f} {summary['score']:>8.1f} "
+              f"{summary['kills']:>7.1f} {summary['deaths']:>7.0%}")
+
+    # CPU time spent inside games against wall time shows how well the pool
+    # scales: one worker's games would have taken at least that much wall time
+    frames = sum(game['frames'] for results in games for game in results)
+    busy = sum(game['cpu'] for results in games for game in results)
+    print(f"{len(tasks)} games, {frames} frames in {wall:.1f}s: {frames / wall:.0f} frames/s, "
+          f"{busy / wall:.1f}x parallel speedup on {args.workers} workers")
+    if args.out:
+        write_results(args.out, rows)
+        print(f"Results written to {args.out}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Play headless games across a process pool and compare difficulty settings",
+        epilog="example: --param enemy_spawn_rate=0.01,0.02 --param enemy_speed_range=1:3,2:5")
+    parser.add_argument('--difficulty', choices=sf.DIFFICULTY, default='normal',
+                        help="table entry the swept settings override")
+    parser.add_argument('--param', type=parse_param, action='append', default=[],
+                        metavar='NAME=VALUES', help="a difficulty setting and the values to try")
+    parser.add_argument('--games', type=int, default=20, help="games per parameter set")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the first game of each set")
+    parser.add_argument('--policy', default='chaser',
+                        help=f"one of {', '.join(sf.POLICIES)}, or module:factory")
+    parser.add_argument('--frames', type=int, default=sf.FPS * 60 * 10,
+                        help="frame limit per game")
+    parser.add_argument('--backend', choices=('sprites', 'numpy'), default='sprites')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--out', metavar='FILE', help="write the per-set results as .csv or .json")
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    run_sweep(parse_args())